@@ -1,70 +1,133 @@
-    from flask import Flask, request, jsonify
-    from flask_cors import CORS
-    import paramiko
-    import json
-    import os
-    import requests
-    import re
-    import psycopg2 # Import the PostgreSQL adapter. Change this if you use a different DB.
-    from psycopg2 import Error as Psycopg2Error # Specific error handling for psycopg2
-
-    app = Flask(__name__)
-    CORS(app)
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    @app.route('/api/save-schema', methods=['POST'])
-    def save_schema():
-        """
-        Handles the POST request to save a schema to a JSON file on the SFTP server.
-        """
-        if not request.is_json:
-            print("DEBUG: Request is not JSON in save_schema.")
-            return jsonify({"message": "Request must be JSON"}), 400
-
-        data = request.get_json()
-
-        sftp_details = data.get('sftp')
-        schema_name = data.get('name')
-        fields = data.get("Fields in database table")
-        training_sets = data.get('trainingSets')
-        llm_endpoint = data.get('llmEndpoint')
-        db_credentials = data.get('dbCredentials')
-
-        if not sftp_details or not schema_name or not fields:
-            print("DEBUG: Missing SFTP details, schema name, or fields for save_schema")
-            return jsonify({"message": "Missing SFTP details, schema name, or fields"}), 400
-
-        host = sftp_details.get('host')
-        username = sftp_details.get('username')
-        password = sftp_details.get('password')
-        port = int(sftp_details.get('port', 22))
-
-        if not host or not username or not password:
-            print("DEBUG: SFTP host, username, or password missing for save_schema")
-            return jsonify({"message": "SFTP host, username, or password missing"}), 400
-
-        schema_to_save = {
-            "schemaName": schema_name,
-            "Fields in database table": fields,
-            "trainingSets": training_sets,
-            "llmEndpoint": llm_endpoint,
-            "dbCredentials": db_credentials
-        }
-
-        remote_sftp_path = f"/schemas/{schema_name}.json"
-        json_content = json.dumps(schema_to_save, indent=4)
-
-        transport = None
-        sftp = None
-        try:
-            transport = paramiko.Transport((host, port))
-            transport.connect(username=username, password=password)
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            
+from flask import Flask, Response, g, request, jsonify
+from flask_cors import CORS
+import paramiko
+import json
+import logging
+import os
+import requests
+import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+import llm_client
+import llm_stream
+import log_config
+import metrics
+import profiler
+import prompt_builder
+import query_executor
+import query_guard
+import result_cache
+import row_serializer
+import schema_cache
+import sftp_pool
+import translation_cache
+from prompt_builder import get_nested_value
+
+log_config.configure()
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+app.json = row_serializer.JSONProvider(app) # orjson-backed when installed; same output either way (NaN as null, UTF-8)
+CORS(app)
+
+SCHEMA_MAX_BYTES = int(os.environ.get("SCHEMA_MAX_BYTES", 5 * 1024 * 1024)) # Largest schema document get_schema will load
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 50))              # Most queries or questions one batch request may hold
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", 4))   # LLM calls one chat batch keeps in flight at once
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Request Timing and Profiling
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+    g.profile = profiler.start()
+
+
+@app.after_request
+def end_request_timing(response):
+    """
+    Records the request in the /metrics histograms and logs one summary line with its phase
+    breakdown. For streamed responses this covers the time until the first byte is ready.
+    """
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    phases = metrics.end_request(endpoint, request.method, response.status_code, seconds)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.stop(profile, f"{request.method} {endpoint}")
+    # Building the phase breakdown costs more than the rest of this hook, so skip it when INFO is off
+    if endpoint != '/metrics' and logger.isEnabledFor(logging.INFO):
+        logger.info("%s %s %s %.1fms%s", request.method, request.path, response.status_code, seconds * 1000,
+                    "".join(f" {name}={phase_seconds * 1000:.1f}ms" for name, phase_seconds in phases.items()),
+                    extra={"durationMs": round(seconds * 1000, 3),
+                           "phasesMs": {name: round(phase_seconds * 1000, 3) for name, phase_seconds in phases.items()}})
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(error):
+    # after_request is skipped when a view raises; release the profiler anyway
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.stop(profile, f"{request.method} {request.path}")
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/save-schema', methods=['POST'])
+def save_schema():
+    """
+    Handles the POST request to save a schema to a JSON file on the SFTP server.
+    """
+    if not request.is_json:
+        logger.info("Request is not JSON in save_schema.")
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+
+    sftp_details = data.get('sftp')
+    schema_name = data.get('name')
+    fields = data.get("Fields in database table")
+    training_sets = data.get('trainingSets')
+    llm_endpoint = data.get('llmEndpoint')
+    db_credentials = data.get('dbCredentials')
+
+    if not sftp_details or not schema_name or not fields:
+        logger.info("Missing SFTP details, schema name, or fields for save_schema")
+        return jsonify({"message": "Missing SFTP details, schema name, or fields"}), 400
+
+    host = sftp_details.get('host')
+    username = sftp_details.get('username')
+    password = sftp_details.get('password')
+    port = int(sftp_details.get('port', 22))
+
+    if not host or not username or not password:
+        logger.info("SFTP host, username, or password missing for save_schema")
+        return jsonify({"message": "SFTP host, username, or password missing"}), 400
+
+    schema_to_save = {
+        "schemaName": schema_name,
+        "Fields in database table": fields,
+        "trainingSets": training_sets,
+        "llmEndpoint": llm_endpoint,
+        "dbCredentials": db_credentials
+    }
+
+    remote_sftp_path = f"/schemas/{schema_name}.json"
+    json_content = json.dumps(schema_to_save, indent=4)
+
+    try:
+        with sftp_pool.get_pool(host, port, username, password).sftp() as sftp:
             try:
                 sftp.stat(remote_sftp_path)
-                print(f"DEBUG: Schema '{schema_name}' already exists.")
+                logger.info("Schema '%s' already exists.", schema_name)
                 return jsonify({"message": f"Error: Schema with the name '{schema_name}' already exists. Please use a different name."}), 409
             except FileNotFoundError:
                 pass
@@ -73,399 +136,602 @@
             try:
                 sftp.stat(remote_dir)
             except FileNotFoundError:
-                print(f"DEBUG: Creating remote SFTP directory: {remote_dir}")
+                logger.debug("Creating remote SFTP directory: %s", remote_dir)
                 sftp.mkdir(remote_dir)
 
             with sftp.open(remote_sftp_path, 'w') as f:
                 f.write(json_content)
 
-            print(f"DEBUG: Schema '{schema_name}' uploaded successfully.")
-            return jsonify({"message": f"Schema '{schema_name}' uploaded successfully to {remote_sftp_path}"}), 200
-
-        except paramiko.AuthenticationException:
-            print("DEBUG: SFTP AuthenticationException in save_schema")
-            return jsonify({"message": "SFTP authentication failed. Check username and password."}), 401
-        except paramiko.SSHException as e:
-            print(f"DEBUG: SSHException in save_schema: {str(e)}")
-            return jsonify({"message": f"Could not establish SSH connection: {str(e)}"}), 500
-        except Exception as e:
-            print(f"DEBUG: Generic Exception in save_schema: {str(e)}")
-            return jsonify({"message": f"An error occurred during SFTP transfer: {str(e)}"}), 500
-        finally:
-            if sftp:
-                sftp.close()
-            if transport:
-                transport.close()
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    @app.route('/api/get-schema', methods=['POST'])
-    def get_schema():
-        """
-        Handles the POST request to retrieve a schema from the SFTP server.
-        """
-        if not request.is_json:
-            print("DEBUG: Request is not JSON in get_schema.")
-            return jsonify({"message": "Request must be JSON"}), 400
-
-        data = request.get_json()
-        schema_name = data.get('schemaName')
-        sftp_details = data.get('sftp')
-
-        if not schema_name or not sftp_details:
-            print("DEBUG: Missing schemaName or SFTP details for get_schema")
-            return jsonify({"message": "schemaName and SFTP details are required."}), 400
-
-        host = sftp_details.get('host')
-        username = sftp_details.get('username')
-        password = sftp_details.get('password')
-        port = int(sftp_details.get('port', 22))
-
-        if not host or not username or not password:
-            print("DEBUG: SFTP host, username, or password missing for get_schema")
-            return jsonify({"message": "SFTP host, username, or password missing"}), 400
-
-        remote_sftp_path = f"/schemas/{schema_name}.json"
-        local_temp_path = f"{schema_name}_temp.json"
-
-        transport = None
-        sftp = None
-        try:
-            transport = paramiko.Transport((host, port))
-            transport.connect(username=username, password=password)
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            
-            sftp.get(remote_sftp_path, local_temp_path)
-            
-            with open(local_temp_path, 'r') as f:
-                schema_content = json.load(f)
-            
-            os.remove(local_temp_path)
-            print(f"DEBUG: Schema '{schema_name}' retrieved successfully.")
-            return jsonify(schema_content), 200
-        
-        except paramiko.AuthenticationException:
-            print("DEBUG: SFTP AuthenticationException in get_schema")
-            return jsonify({"message": "SFTP authentication failed."}), 401
-        except FileNotFoundError:
-            print(f"DEBUG: Schema '{schema_name}' not found on SFTP server.")
-            return jsonify({"message": f"Schema '{schema_name}' not found on the SFTP server."}), 404
-        except Exception as e:
-            print(f"DEBUG: Generic Exception in get_schema: {str(e)}")
-            return jsonify({"message": f"An error occurred: {str(e)}"}), 500
-        finally:
-            if sftp:
-                sftp.close()
-            if transport:
-                transport.close()
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    @app.route('/api/chat-query', methods=['POST'])
-    def chat_query():
-        """
-        Receives a user query and a schema, then proxies the request to the LLM endpoint.
-        It now handles LLM responses that are either prefixed with 'query ->' (for SQL queries) or plain text.
-        """
-        if not request.is_json:
-            print("DEBUG: Request is not JSON in chat_query.")
-            return jsonify({"message": "Request must be JSON"}), 400
-
-        data = request.get_json()
-        user_query = data.get('query')
-        schema = data.get('schema')
-
-        if not user_query or not schema:
-            print("DEBUG: Missing query or schema in chat_query.")
-            return jsonify({"message": "Query or schema is missing from the request."}), 400
-
-        llm_endpoint_config = schema.get('llmEndpoint')
-        db_credentials = schema.get('dbCredentials')
-
-        if not llm_endpoint_config or not llm_endpoint_config.get('url'):
-            print("DEBUG: LLM endpoint URL not configured in schema.")
-            return jsonify({"message": "LLM endpoint URL is not configured in the schema."}), 400
-        
-        response_key = llm_endpoint_config.get('body', {}).get('responseKey', '').strip()
-        if not response_key:
-            print("DEBUG: LLM response key not configured in schema.")
-            return jsonify({"message": "LLM response key is not configured in the schema."}), 400
-
-        fields_in_table = schema.get("Fields in database table", "No fields provided.")
-        schema_name = schema.get("schemaName", "your database table")
-        training_sets = schema.get("trainingSets", [])
-
-        training_examples_str = ""
-        if training_sets:
-            training_examples_str = "\n".join([
-                f"Question: {ts['input']}\nSQL Query: {ts['output']}"
-                for ts in training_sets
-            ])
-        
-        # Updated system prompt to instruct LLM for "query -> " prefix
-        system_prompt = f"""You are a Database Query Builder for Table {schema_name}.
-    These are the fields in the database:
-    {fields_in_table}
-    """
-        if training_examples_str:
-            system_prompt += f"""You have the following training examples to guide your query building:
-    {training_examples_str}
-    """
-        system_prompt += """Your job:
-    - Convert user questions into valid SQL queries using the schema and training examples.
-    - Always return only the SQL query unless the user is just greeting you.
-    Special rules:
-    - If the user says "hi", "hello", "hey", or similar greetings, respond politely with a short friendly greeting.
-    - If the user asks about anything outside SQL queries (e.g., coding, stories, general knowledge), reply only with:
-     "I am not trained for this"
-    - If the user asked questions related to the database and you are able to create a query, then return your response prefixed with "query -> " followed by the SQL query.
-    Example: "query -> SELECT * FROM customers WHERE total_orders > 10;"
-    If you cannot make the query (e.g., for greetings, "not trained", or "cannot provide") then return your response as a simple string without any prefix.
-    """
-
-        headers = {'Content-Type': 'application/json'}
-        if llm_endpoint_config['authType'] == 'Authorization Header':
-            headers['Authorization'] = llm_endpoint_config['credentials']['authHeader']
-        for header in llm_endpoint_config.get('extraHeaders', []):
-            headers[header['key']] = header['value']
-
-        request_body = {}
-        
-        llm_body_config = llm_endpoint_config.get('body', {})
-        sample_json_str = llm_body_config.get('sampleJson', '').strip()
-        query_key = llm_body_config.get('queryKey', '').strip()
-
-        if sample_json_str and query_key:
-            try:
-                request_body = json.loads(sample_json_str)
-                set_nested_value(request_body, query_key, system_prompt + user_query)
-            except json.JSONDecodeError:
-                print("DEBUG: Invalid JSON in LLM request body in chat_query.")
-                return jsonify({"message": "Invalid JSON in LLM request body. Please check the sample JSON format."}), 400
-            except (IndexError, TypeError) as e:
-                print(f"DEBUG: Error with Query Key path in chat_query: {str(e)}")
-                if "list" in str(e) and "string" in str(e):
-                    return jsonify({"message": f"Error with Query Key path: It seems you're trying to access a list with a string key. Remember to use numeric indices for lists (e.g., 'items.0.name' not 'items.name'). Original error: {str(e)}"}), 400
-                else:
-                    return jsonify({"message": f"Error with Query Key path: {str(e)}. Please check the Query Key format."}), 400
-        else:
-            request_body = {'query': system_prompt + user_query}
-            
-        print("\n--- Payload to LLM ---")
-        print(json.dumps(request_body, indent=2))
-        print("--- End Payload ---\n")
-        
-        try:
-            response = requests.post(llm_endpoint_config['url'], headers=headers, json=request_body)
+            # Write-through: the next get_schema for this file is served from memory.
+            attrs = sftp.stat(remote_sftp_path)
+            schema_cache.invalidate_schema(host, port, schema_name)
+            schema_cache.put(schema_cache.cache_key(host, port, username, schema_name), password, schema_to_save, attrs)
+            translation_cache.invalidate_schema(schema_name)
+
+        warm_compiled_schema(schema_to_save)
+
+        logger.info("Schema '%s' uploaded successfully.", schema_name)
+        return jsonify({"message": f"Schema '{schema_name}' uploaded successfully to {remote_sftp_path}"}), 200
+
+    except paramiko.AuthenticationException:
+        logger.warning("SFTP AuthenticationException in save_schema")
+        return jsonify({"message": "SFTP authentication failed. Check username and password."}), 401
+    except paramiko.SSHException as e:
+        logger.error("SSHException in save_schema: %s", e)
+        return jsonify({"message": f"Could not establish SSH connection: {str(e)}"}), 500
+    except sftp_pool.SFTPPoolTimeoutError as e:
+        logger.warning("SFTPPoolTimeoutError in save_schema: %s", e)
+        return jsonify({"message": f"SFTP server is busy, please retry: {str(e)}"}), 503
+    except Exception as e:
+        logger.exception("Generic Exception in save_schema: %s", e)
+        return jsonify({"message": f"An error occurred during SFTP transfer: {str(e)}"}), 500
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/get-schema', methods=['POST'])
+def get_schema():
+    """
+    Handles the POST request to retrieve a schema from the SFTP server.
+    """
+    if not request.is_json:
+        logger.info("Request is not JSON in get_schema.")
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    schema_name = data.get('schemaName')
+    sftp_details = data.get('sftp')
+
+    if not schema_name or not sftp_details:
+        logger.info("Missing schemaName or SFTP details for get_schema")
+        return jsonify({"message": "schemaName and SFTP details are required."}), 400
+
+    host = sftp_details.get('host')
+    username = sftp_details.get('username')
+    password = sftp_details.get('password')
+    port = int(sftp_details.get('port', 22))
+
+    if not host or not username or not password:
+        logger.info("SFTP host, username, or password missing for get_schema")
+        return jsonify({"message": "SFTP host, username, or password missing"}), 400
+
+    remote_sftp_path = f"/schemas/{schema_name}.json"
+
+    cache_key = schema_cache.cache_key(host, port, username, schema_name)
+    cached = schema_cache.lookup(cache_key, password)
+    if cached and cached[1]:
+        schema_cache.record_hit()
+        logger.debug("Schema '%s' served from cache.", schema_name)
+        return jsonify(cached[0].document), 200
+
+    try:
+        with sftp_pool.get_pool(host, port, username, password).sftp() as sftp, metrics.phase(metrics.SCHEMA_DOWNLOAD):
+            attrs = sftp.stat(remote_sftp_path)
+            if cached and cached[0].matches(attrs):
+                schema_cache.record_revalidated(cache_key)
+                logger.debug("Schema '%s' unchanged on SFTP server, served from cache.", schema_name)
+                return jsonify(cached[0].document), 200
+
+            if attrs.st_size is not None and attrs.st_size > SCHEMA_MAX_BYTES:
+                logger.info("Schema '%s' is %s bytes, over the %s byte limit.", schema_name, attrs.st_size, SCHEMA_MAX_BYTES)
+                return jsonify({"message": f"Schema '{schema_name}' is too large to load ({attrs.st_size} bytes, limit {SCHEMA_MAX_BYTES})."}), 413
+
+            # Read straight into memory; prefetch pipelines the SFTP read requests instead of one round trip per block.
+            with sftp.open(remote_sftp_path, 'rb') as f:
+                f.prefetch(attrs.st_size)
+                raw_schema = f.read(SCHEMA_MAX_BYTES + 1)
+
+        if len(raw_schema) > SCHEMA_MAX_BYTES:
+            logger.info("Schema '%s' grew past the %s byte limit while being read.", schema_name, SCHEMA_MAX_BYTES)
+            return jsonify({"message": f"Schema '{schema_name}' is too large to load (limit {SCHEMA_MAX_BYTES} bytes)."}), 413
+
+        schema_content = json.loads(raw_schema)
+        schema_cache.store(cache_key, password, schema_content, attrs)
+        warm_compiled_schema(schema_content)
+        logger.info("Schema '%s' retrieved successfully.", schema_name)
+        return jsonify(schema_content), 200
+    
+    except paramiko.AuthenticationException:
+        logger.warning("SFTP AuthenticationException in get_schema")
+        return jsonify({"message": "SFTP authentication failed."}), 401
+    except FileNotFoundError:
+        schema_cache.invalidate(cache_key)
+        logger.info("Schema '%s' not found on SFTP server.", schema_name)
+        return jsonify({"message": f"Schema '{schema_name}' not found on the SFTP server."}), 404
+    except sftp_pool.SFTPPoolTimeoutError as e:
+        logger.warning("SFTPPoolTimeoutError in get_schema: %s", e)
+        return jsonify({"message": f"SFTP server is busy, please retry: {str(e)}"}), 503
+    except Exception as e:
+        logger.exception("Generic Exception in get_schema: %s", e)
+        return jsonify({"message": f"An error occurred: {str(e)}"}), 500
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/chat-query', methods=['POST'])
+def chat_query():
+    """
+    Receives a user query and a schema, then proxies the request to the LLM endpoint.
+    It now handles LLM responses that are either prefixed with 'query ->' (for SQL queries) or plain text.
+    With "stream": true the answer is sent as server-sent events while the LLM is still replying
+    (see stream_chat_events).
+    """
+    if not request.is_json:
+        logger.info("Request is not JSON in chat_query.")
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    user_query = data.get('query')
+    schema = data.get('schema')
+    stream = bool(data.get('stream'))
+
+    if not user_query or not schema:
+        logger.info("Missing query or schema in chat_query.")
+        return jsonify({"message": "Query or schema is missing from the request."}), 400
+
+    db_credentials = schema.get('dbCredentials')
+    compiled, error = compile_chat_schema(schema, "chat_query")
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Repeated questions against an unchanged schema reuse the SQL the LLM produced last time.
+    translation_key = translation_cache.cache_key(compiled, user_query) if data.get('cache', True) else None
+    cached_sql = translation_cache.lookup(translation_key)
+    if cached_sql is not None and db_credentials:
+        logger.debug("Using cached SQL translation: %s", cached_sql)
+        result, status = query_executor.execute_query(db_credentials, cached_sql, query_guard.CHAT_POLICY)
+        if stream:
+            return sse_response([sse_event('sql', {"query": cached_sql}), sse_event('result', {"status": status, **result}), sse_event('done', {})])
+        return jsonify(result), status
+
+    request_body = build_llm_request(compiled, user_query, stream=stream)
+    
+    try:
+        if stream:
+            llm_started = time.perf_counter()
+            response = llm_client.post(compiled.url, compiled.headers, request_body, stream=True)
+            if not response.ok:
+                response.close()
             response.raise_for_status()
-            
-            llm_response_data = response.json()
-            print(f"DEBUG: Raw LLM response data: {json.dumps(llm_response_data, indent=2)}")
-            
-            llm_response_text = get_nested_value(llm_response_data, response_key)
-            print(f"DEBUG: Extracted LLM response text: {llm_response_text}")
-
-            # Define the prefix for SQL queries
-            SQL_PREFIX = "query -> "
-
-            if llm_response_text.strip().lower().startswith(SQL_PREFIX.lower()):
-                # Extract the SQL query by removing the prefix
-                sql_query = llm_response_text.strip()[len(SQL_PREFIX):].strip()
-                print(f"DEBUG: Successfully extracted SQL from prefixed string: {sql_query}")
-
-                # Validate if it looks like a basic SQL query
-                if not re.match(r"^(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP)\s", sql_query, re.IGNORECASE):
-                    print(f"DEBUG: LLM response with prefix does not appear to be a SQL query: {sql_query}")
-                    return jsonify({"response": "I'm sorry, I couldn't generate a valid SQL query for that request. Please try rephrasing."}), 200
-
-                if not db_credentials:
-                    print("DEBUG: Database credentials not provided in schema for query execution.")
-                    return jsonify({"message": "Database credentials are not provided in the schema."}), 400
-                
-                db_query_payload = {
-                    "dbCredentials": db_credentials,
-                    "query": sql_query
-                }
-                print(f"DEBUG: Sending to /api/run-query for DB execution: {json.dumps(db_query_payload, indent=2)}")
-                
-                db_response = requests.post("http://localhost:5000/api/run-query", json=db_query_payload)
-                db_response.raise_for_status()
-                
-                print(f"DEBUG: Received response from /api/run-query: {db_response.json()}")
-                return jsonify(db_response.json()), 200
-            else:
-                # If the response does not start with the SQL_PREFIX, treat it as a plain text message
-                print("DEBUG: LLM response does not start with SQL prefix. Treating as plain text.")
-                return jsonify({"response": llm_response_text}), 200
-
-        except requests.exceptions.RequestException as e:
-            print(f"DEBUG: RequestException in chat_query (LLM or internal DB endpoint): {str(e)}")
-            return jsonify({"message": f"Error connecting to LLM or internal DB endpoint: {str(e)}"}), 502
-        except Exception as e:
-            print(f"DEBUG: Generic Exception in chat_query: {str(e)}")
-            return jsonify({"message": f"An unexpected error occurred: {str(e)}"}), 500
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    # New Route to Run SQL Query to the Actual Database
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    @app.route('/api/run-query', methods=['POST'])
-    def run_query():
-        """
-        Connects to the database and runs the provided SQL query, returning the results.
-        """
-        if not request.is_json:
-            print("DEBUG: Request is not JSON in run_query.")
-            return jsonify({"message": "Request must be JSON"}), 400
-
-        data = request.get_json()
-        db_credentials = data.get('dbCredentials')
-        query = data.get('query')
-
-        print(f"DEBUG: Received DB query request. Credentials provided: {bool(db_credentials)}, Query provided: {bool(query)}")
-        print(f"DEBUG: Query to execute: {query}")
-
-        if not db_credentials or not query:
-            print("DEBUG: Missing DB credentials or query for run_query.")
-            return jsonify({"message": "Database credentials or query is missing."}), 400
-
-        # Use environment variables for database connection
-        db_host = os.environ.get("DB_HOST", db_credentials.get('host'))
-        db_user = os.environ.get("DB_USER", db_credentials.get('user'))
-        db_password = os.environ.get("DB_PASSWORD", db_credentials.get('password'))
-        db_name = os.environ.get("DB_NAME", db_credentials.get('database'))
-        db_port = os.environ.get("DB_PORT", db_credentials.get('port')) # Default to 5432 if not set
-
-        if not all([db_host, db_user, db_password, db_name, db_port]):
-            print("DEBUG: Incomplete database credentials for run_query.")
-            return jsonify({"message": "Incomplete database credentials provided. Ensure DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT are set as environment variables or provided in schema."}), 400
-
-        conn = None
-        cursor = None
-        try:
-            print(f"DEBUG: Attempting to connect to DB: host={db_host}, port={db_port}, user={db_user}, database={db_name}")
-            conn = psycopg2.connect(
-                host=db_host,
-                port=db_port,
-                user=db_user,
-                password=db_password,
-                database=db_name,
-                sslmode='require' # Often needed for cloud databases like Render
-            )
-            cursor = conn.cursor()
-            print("DEBUG: Database connection established.")
-
-            cursor.execute(query)
-            print("DEBUG: Query executed successfully.")
-            
-            if cursor.description: # If it's a SELECT query, fetch results.
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]
-                rows = [dict(zip(column_names, row)) for row in results]
-                print(f"DEBUG: Fetched {len(rows)} rows from DB.")
-                return jsonify({"response": rows}), 200
-            else: # For non-SELECT queries (INSERT, UPDATE, DELETE), commit changes and return success
-                conn.commit()
-                print(f"DEBUG: Non-SELECT query committed. Rows affected: {cursor.rowcount}")
-                return jsonify({"response": f"Query executed successfully. Rows affected: {cursor.rowcount}"}), 200
-
-        except Psycopg2Error as e:
-            # Ensure e.pgerror is not None before stripping
-            pg_error_message = e.pgerror.strip() if e.pgerror else "Unknown database error."
-            print(f"DEBUG: Psycopg2Error in run_query: {e.pgcode} - {pg_error_message}")
-            # Check if the error is due to a syntax error or a non-SQL command
-            if e.pgcode == '42601': # Syntax error
-                return jsonify({"message": f"Database query failed: Invalid SQL syntax or non-SQL command. Details: {pg_error_message}"}), 400
-            else:
-                return jsonify({"message": f"Database error: {e.pgcode} - {pg_error_message}"}), 500
-        except Exception as e:
-            print(f"DEBUG: Generic Exception in run_query: {str(e)}")
-            return jsonify({"message": f"An unexpected error occurred during database operation: {str(e)}"}), 500
-        finally:
-            if cursor:
-                cursor.close()
-                print("DEBUG: Cursor closed.")
-            if conn:
-                conn.close()
-                print("DEBUG: DB connection closed.")
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    # Helper Functions (set_nested_value and get_nested_value remain the same)
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    def set_nested_value(data, keys, value):
-        """
-        Helper function to set a value in a nested dictionary or list.
-        'keys' can be a string like 'messages.0.content' or 'parts[0].text'.
-        """
-        keys_list = re.findall(r'(\w+)|\[(\d+)\]', keys)
-        keys_list = [item for sublist in keys_list for item in sublist if item]
-        
-        current_data = data
-        for i, key_part in enumerate(keys_list[:-1]):
-            if key_part.isdigit():
-                key_val = int(key_part)
-                if not isinstance(current_data, list):
-                    raise TypeError(f"Path segment '{key_part}' (index) is used on a non-list type '{type(current_data).__name__}'. Full path: '{keys}'")
-                if key_val >= len(current_data):
-                    raise IndexError(f"List index '{key_val}' out of range. Full path: '{keys}'")
-                current_data = current_data[key_val]
-            else:
-                if not isinstance(current_data, dict):
-                    raise TypeError(f"Path segment '{key_part}' (key) is used on a non-dict type '{type(current_data).__name__}'. Full path: '{keys}'")
-                current_data = current_data[key_part]
-        
-        final_key_part = keys_list[-1]
-        if final_key_part.isdigit():
-            final_key_val = int(final_key_part)
-            if not isinstance(current_data, list):
-                raise TypeError(f"Final path segment '{final_key_part}' (index) is used on a non-list type '{type(current_data).__name__}'. Full path: '{keys}'")
-            if final_key_val >= len(current_data):
-                raise IndexError(f"List index '{final_key_val}' out of range. Full path: '{keys}'")
-            current_data[final_key_val] = value
+            logger.debug("Streaming LLM response to the client as server-sent events.")
+            return sse_response(stream_chat_events(response, compiled, db_credentials, translation_key, llm_started))
+
+        llm_response_text, llm_seconds = ask_llm(compiled, request_body)
+        sql_query = extract_sql(llm_response_text)
+        if sql_query is None:
+            # If the response does not start with the SQL_PREFIX, treat it as a plain text message
+            return jsonify({"response": llm_response_text}), 200
+
+        result, status = run_generated_sql(sql_query, db_credentials, translation_key, llm_seconds)
+        return jsonify(result), status
+
+    except Exception as e:
+        result, status = llm_error_result(e, "chat_query")
+        return jsonify(result), status
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/chat-query-batch', methods=['POST'])
+def chat_query_batch():
+    """
+    Answers several questions against one schema in a single request.
+    Expects {"schema": {...}, "queries": ["question", ...]} and returns {"results": [...]}, one
+    {"status", ...} item per question holding what /api/chat-query would have answered.
+    Up to BATCH_LLM_CONCURRENCY questions are sent to the LLM at once; the generated SQL then
+    runs in order over a single database connection.
+    """
+    if not request.is_json:
+        logger.info("Request is not JSON in chat_query_batch.")
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    questions = data.get('queries')
+    schema = data.get('schema')
+
+    if not schema or not questions or not isinstance(questions, list):
+        logger.info("Missing queries or schema in chat_query_batch.")
+        return jsonify({"message": "Queries (a non-empty list) or schema is missing from the request."}), 400
+    if len(questions) > BATCH_MAX_ITEMS:
+        logger.info("Batch of %s questions is over the %s item limit.", len(questions), BATCH_MAX_ITEMS)
+        return jsonify({"message": f"Too many queries in one batch ({len(questions)}, limit {BATCH_MAX_ITEMS})."}), 413
+
+    db_credentials = schema.get('dbCredentials')
+    compiled, error = compile_chat_schema(schema, "chat_query_batch")
+    if error:
+        return jsonify(error[0]), error[1]
+
+    results = [None] * len(questions)
+    generated = [] # (index, SQL, translation key, LLM seconds or None when the SQL came from the cache)
+    asked = []
+
+    for index, user_query in enumerate(questions):
+        if not isinstance(user_query, str) or not user_query.strip():
+            results[index] = {"status": 400, "message": "Query must be a non-empty string."}
+            continue
+        translation_key = translation_cache.cache_key(compiled, user_query) if data.get('cache', True) else None
+        cached_sql = translation_cache.lookup(translation_key)
+        if cached_sql is not None and db_credentials:
+            logger.debug("Using cached SQL translation: %s", cached_sql)
+            generated.append((index, cached_sql, translation_key, None))
         else:
-            if not isinstance(current_data, dict):
-                raise TypeError(f"Final path segment '{final_key_part}' (key) is used on a non-dict type '{type(current_data).__name__}'. Full path: '{keys}'")
-            current_data[final_key_part] = value
-
-    def get_nested_value(data, keys):
-        """
-        Helper function to get a value from a nested dictionary or list.
-        'keys' can be a string like 'candidates.0.content.parts.0.text'.
-        """
-        keys_list = re.findall(r'(\w+)|\[(\d+)\]', keys)
-        keys_list = [item for sublist in keys_list for item in sublist if item]
-
-        current_data = data
-        for key_part in keys_list:
-            if isinstance(current_data, dict):
-                current_data = current_data.get(key_part)
-            elif isinstance(current_data, list):
+            asked.append((index, user_query, translation_key))
+
+    if asked:
+        def ask(user_query):
+            return ask_llm(compiled, build_llm_request(compiled, user_query))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_LLM_CONCURRENCY, len(asked)))) as executor:
+            # Each call runs in a copy of the request's context, so its phase timings still reach the request
+            futures = [executor.submit(contextvars.copy_context().run, ask, user_query) for _, user_query, _ in asked]
+            for (index, _, translation_key), future in zip(asked, futures):
                 try:
-                    current_data = current_data[int(key_part)]
-                except (ValueError, IndexError, TypeError):
-                    current_data = None
-            else:
-                current_data = None
-            
-            if current_data is None:
-                return 'No response content found.'
-
-        return current_data
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    @app.route('/')
-    def home():
-        """
-        Basic route to confirm the Flask backend is running.
-        """
-        return "Python Backend is Running!"
-
-    #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-
-    if __name__ == '__main__':
-        # Use environment variable for port, default to 5000 for local dev
-        port = int(os.environ.get("PORT", 5000))
-        app.run(host='0.0.0.0', port=port, debug=False) # Set debug=False for production
-    
+                    llm_response_text, llm_seconds = future.result()
+                    sql_query = extract_sql(llm_response_text)
+                except Exception as e:
+                    result, status = llm_error_result(e, "chat_query_batch")
+                    results[index] = {"status": status, **result}
+                    continue
+                if sql_query is None:
+                    results[index] = {"status": 200, "response": llm_response_text}
+                    continue
+                error = generated_sql_error(sql_query, db_credentials)
+                if error:
+                    results[index] = {"status": error[1], **error[0]}
+                    continue
+                generated.append((index, sql_query, translation_key, llm_seconds))
+
+    if generated:
+        generated.sort()
+        logger.debug("Executing %s generated SQL statements over one connection.", len(generated))
+        # LLM-written SQL runs under the stricter chat policy (row limit, optional read-only transaction)
+        batch, status = query_executor.execute_batch(db_credentials, [sql_query for _, sql_query, _, _ in generated], query_guard.CHAT_POLICY)
+        if status != 200:
+            for index, _, _, _ in generated:
+                results[index] = {"status": status, "message": batch["message"]}
+        else:
+            for (index, sql_query, translation_key, llm_seconds), item in zip(generated, batch["results"]):
+                results[index] = item
+                if llm_seconds is not None and item["status"] == 200:
+                    translation_cache.store(translation_key, sql_query, llm_seconds)
+
+    return jsonify({"results": results}), 200
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# New Route to Run SQL Query to the Actual Database
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/run-query', methods=['POST'])
+def run_query():
+    """
+    Connects to the database and runs the provided SQL query, returning the results.
+    """
+    if not request.is_json:
+        logger.info("Request is not JSON in run_query.")
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    db_credentials = data.get('dbCredentials')
+    query = data.get('query')
+
+    logger.debug("Received DB query request. Credentials provided: %s, Query provided: %s", bool(db_credentials), bool(query))
+    logger.debug("Query to execute: %s", query)
+
+    if not db_credentials or not query:
+        logger.info("Missing DB credentials or query for run_query.")
+        return jsonify({"message": "Database credentials or query is missing."}), 400
+
+    if data.get('stream') and query_executor.is_streamable(query):
+        output_format = data.get('format', 'ndjson')
+        if output_format not in ('ndjson', 'json'):
+            logger.info("Unsupported stream format for run_query: %s", output_format)
+            return jsonify({"message": "Unsupported stream format. Use 'ndjson' or 'json'."}), 400
+
+        max_rows = data.get('maxRows')
+        if isinstance(max_rows, str) and max_rows.strip().isdigit():
+            max_rows = int(max_rows)
+        if max_rows is not None and (not isinstance(max_rows, int) or isinstance(max_rows, bool) or max_rows < 0):
+            logger.info("Invalid maxRows for run_query: %r", max_rows)
+            return jsonify({"message": "maxRows must be a non-negative integer (0 means no limit)."}), 400
+
+        result, status = query_executor.stream_query(
+            db_credentials,
+            query,
+            app.json.dumps,
+            output_format=output_format,
+            max_rows=max_rows,
+            columnar=bool(data.get('columnar'))
+        )
+        if status != 200:
+            return jsonify(result), status
+        mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+        return Response(result, status=200, mimetype=mimetype, headers={"X-Accel-Buffering": "no"})
+
+    # Repeated read-only SELECTs can be answered from already encoded results (RESULT_CACHE_ENABLED)
+    cache_key = query_executor.result_cache_key(db_credentials, query) if data.get('cache', True) else None
+    cached_body = result_cache.lookup(cache_key)
+    if cached_body is not None:
+        logger.debug("Serving run_query result from the result cache.")
+        return Response(cached_body, status=200, mimetype='application/json')
+
+    # Taken before the query runs, so a write committed meanwhile keeps this result out of the cache
+    cache_generation = result_cache.generation(cache_key)
+    result, status = query_executor.execute_query(db_credentials, query)
+    if cache_key is not None and status == 200:
+        with metrics.phase(metrics.SERIALIZE):
+            encoded_body = app.json.dumps(result).encode('utf-8')
+        result_cache.store(cache_key, encoded_body, cache_generation)
+        return Response(encoded_body, status=200, mimetype='application/json')
+    return jsonify(result), status
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/run-query-batch', methods=['POST'])
+def run_query_batch():
+    """
+    Runs several SQL statements against one database in a single request.
+    Expects {"dbCredentials": {...}, "queries": ["SQL", ...], "mode": ...} and returns
+    {"results": [...]}, one {"status", ...} item per statement holding what /api/run-query
+    would have returned for it. Modes:
+    - "sequential" (default): in order over one connection, each statement committed on its own
+    - "transaction": in order over one connection, all or nothing ("committed" in the response)
+    - "concurrent": in parallel over up to BATCH_DB_CONCURRENCY pooled connections
+    """
+    if not request.is_json:
+        logger.info("Request is not JSON in run_query_batch.")
+        return jsonify({"message": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    db_credentials = data.get('dbCredentials')
+    queries = data.get('queries')
+    mode = data.get('mode', 'sequential')
+
+    if not db_credentials or not queries or not isinstance(queries, list):
+        logger.info("Missing DB credentials or queries for run_query_batch.")
+        return jsonify({"message": "Database credentials or queries (a non-empty list) are missing."}), 400
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        logger.info("Empty or non-string query in run_query_batch.")
+        return jsonify({"message": "Every query must be a non-empty string."}), 400
+    if len(queries) > BATCH_MAX_ITEMS:
+        logger.info("Batch of %s queries is over the %s item limit.", len(queries), BATCH_MAX_ITEMS)
+        return jsonify({"message": f"Too many queries in one batch ({len(queries)}, limit {BATCH_MAX_ITEMS})."}), 413
+    if mode not in ('sequential', 'transaction', 'concurrent'):
+        logger.info("Unsupported batch mode for run_query_batch: %s", mode)
+        return jsonify({"message": "Unsupported batch mode. Use 'sequential', 'transaction' or 'concurrent'."}), 400
+
+    logger.debug("Running a %s batch of %s queries.", mode, len(queries))
+    if mode == 'concurrent':
+        result, status = query_executor.execute_concurrently(db_credentials, queries)
+    else:
+        result, status = query_executor.execute_batch(db_credentials, queries, transaction=(mode == 'transaction'))
+    return jsonify(result), status
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Helper Functions
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Define the prefix for SQL queries
+SQL_PREFIX = llm_stream.SQL_PREFIX
+SQL_STATEMENT_RE = re.compile(r"^(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP)\s", re.IGNORECASE)
+INVALID_SQL_REPLY = "I'm sorry, I couldn't generate a valid SQL query for that request. Please try rephrasing."
+
+
+def compile_chat_schema(schema, context):
+    """
+    Checks a schema's LLM settings and returns (compiled schema, None), or (None, (body, status))
+    when they cannot be used.
+    """
+    llm_endpoint_config = schema.get('llmEndpoint')
+    if not llm_endpoint_config or not llm_endpoint_config.get('url'):
+        logger.info("LLM endpoint URL not configured in schema.")
+        return None, ({"message": "LLM endpoint URL is not configured in the schema."}, 400)
+
+    response_key = llm_endpoint_config.get('body', {}).get('responseKey', '').strip()
+    if not response_key:
+        logger.info("LLM response key not configured in schema.")
+        return None, ({"message": "LLM response key is not configured in the schema."}, 400)
+
+    # Prompt, headers, body template and key paths are compiled once per distinct schema content.
+    with metrics.phase(metrics.PROMPT_BUILD):
+        compiled = prompt_builder.compile_schema(schema)
+    if compiled.error:
+        message, status = compiled.error
+        logger.info("Unusable LLM body settings in %s: %s", context, message)
+        return None, ({"message": message}, status)
+    return compiled, None
+
+
+def build_llm_request(compiled, user_query, stream=False):
+    """
+    The LLM request body for one question.
+    """
+    with metrics.phase(metrics.PROMPT_BUILD):
+        request_body = compiled.build_request_body(compiled.system_prompt_for(user_query) + user_query, stream=stream)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Payload to LLM:\n%s", json.dumps(request_body, indent=2))
+    return request_body
+
+
+def ask_llm(compiled, request_body):
+    """
+    Sends a request body to the schema's LLM endpoint and returns (reply text, seconds the LLM took).
+    Raises the llm_client / requests exceptions that llm_error_result maps to a response.
+    """
+    llm_started = time.perf_counter()
+    response = llm_client.post(compiled.url, compiled.headers, request_body)
+    response.raise_for_status()
+
+    llm_response_data = response.json()
+    llm_seconds = time.perf_counter() - llm_started
+    metrics.observe_phase(metrics.LLM_CALL, llm_seconds)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw LLM response data: %s", json.dumps(llm_response_data, indent=2))
+
+    llm_response_text = get_nested_value(llm_response_data, compiled.response_path)
+    logger.debug("Extracted LLM response text: %s", llm_response_text)
+    return llm_response_text, llm_seconds
+
+
+def extract_sql(llm_response_text):
+    """
+    The SQL in an LLM reply prefixed with SQL_PREFIX, or None when the reply is plain text.
+    """
+    if not llm_response_text.strip().lower().startswith(SQL_PREFIX.lower()):
+        logger.debug("LLM response does not start with SQL prefix. Treating as plain text.")
+        return None
+    # Extract the SQL query by removing the prefix
+    sql_query = llm_response_text.strip()[len(SQL_PREFIX):].strip()
+    logger.debug("Successfully extracted SQL from prefixed string: %s", sql_query)
+    return sql_query
+
+
+def llm_error_result(e, context):
+    """
+    Maps an exception raised while asking the LLM to a (body, status) pair.
+    """
+    if isinstance(e, llm_client.CircuitOpenError):
+        logger.warning("LLM circuit open in %s: %s", context, e)
+        return {"message": str(e)}, 503
+    if isinstance(e, requests.exceptions.Timeout):
+        logger.warning("Timeout in %s (LLM endpoint): %s", context, e)
+        return {"message": f"LLM endpoint timed out: {str(e)}"}, 504
+    if isinstance(e, requests.exceptions.RequestException):
+        logger.warning("RequestException in %s (LLM endpoint): %s", context, e)
+        return {"message": f"Error connecting to LLM endpoint: {str(e)}"}, 502
+    logger.exception("Generic Exception in %s: %s", context, e)
+    return {"message": f"An unexpected error occurred: {str(e)}"}, 500
+
+
+def generated_sql_error(sql_query, db_credentials):
+    """
+    Returns (body, status) when SQL produced by the LLM cannot be run, else None.
+    """
+    # Validate if it looks like a basic SQL query
+    if not SQL_STATEMENT_RE.match(sql_query):
+        logger.info("LLM response with prefix does not appear to be a SQL query: %s", sql_query)
+        return {"response": INVALID_SQL_REPLY}, 200
+
+    if not db_credentials:
+        logger.info("Database credentials not provided in schema for query execution.")
+        return {"message": "Database credentials are not provided in the schema."}, 400
+    return None
+
+
+def run_generated_sql(sql_query, db_credentials, translation_key, llm_seconds):
+    """
+    Executes SQL produced by the LLM for chat_query and returns (body, status).
+    Successful translations are remembered in the translation cache.
+    """
+    error = generated_sql_error(sql_query, db_credentials)
+    if error:
+        return error
+
+    logger.debug("Executing generated SQL in-process: %s", sql_query)
+    # LLM-written SQL runs under the stricter chat policy (row limit, optional read-only transaction)
+    result, status = query_executor.execute_query(db_credentials, sql_query, query_guard.CHAT_POLICY)
+    if status == 200:
+        translation_cache.store(translation_key, sql_query, llm_seconds)
+    return result, status
+
+
+def sse_event(event, data):
+    """
+    Formats one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    return Response(events, status=200, mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def stream_chat_events(response, compiled, db_credentials, translation_key, llm_started):
+    """
+    Server-sent events for a streamed LLM reply:
+    - 'token' {"text"}: plain-text pieces, forwarded as soon as the reply is known not to be SQL
+    - 'sql' {"query"}: the generated SQL, once the LLM has finished it
+    - 'result' {"status", ...}: the same body the buffered endpoint would return for the SQL
+    - 'error' {"status", "message"}: the LLM stream broke off
+    Every stream ends with 'done'.
+    """
+    splitter = llm_stream.ReplySplitter()
+    try:
+        for piece in llm_stream.iter_text(response, compiled.stream_response_path, compiled.response_path):
+            text = splitter.feed(piece)
+            if text:
+                yield sse_event('token', {"text": text})
+        llm_seconds = time.perf_counter() - llm_started
+        metrics.observe_phase(metrics.LLM_CALL, llm_seconds)
+
+        mode, text = splitter.finish()
+        if mode == 'text':
+            logger.debug("Streamed LLM response does not start with SQL prefix. Treated as plain text.")
+            if text:
+                yield sse_event('token', {"text": text})
+        else:
+            sql_query = text.strip()[len(SQL_PREFIX):].strip()
+            logger.debug("Extracted SQL from streamed LLM response: %s", sql_query)
+            if SQL_STATEMENT_RE.match(sql_query):
+                yield sse_event('sql', {"query": sql_query})
+            result, status = run_generated_sql(sql_query, db_credentials, translation_key, llm_seconds)
+            yield sse_event('result', {"status": status, **result})
+    except requests.exceptions.RequestException as e:
+        logger.warning("LLM stream broke off in chat_query: %s", e)
+        yield sse_event('error', {"status": 502, "message": f"LLM stream interrupted: {str(e)}"})
+    except Exception as e:
+        logger.exception("Generic Exception while streaming chat_query: %s", e)
+        yield sse_event('error', {"status": 500, "message": f"An unexpected error occurred: {str(e)}"})
+    finally:
+        response.close()
+    yield sse_event('done', {})
+
+
+def warm_compiled_schema(schema):
+    """
+    Compiles a freshly saved or loaded schema (prompt parts and training-example index) so the
+    first chat against it does not pay for the build. Problems surface later in chat_query instead.
+    """
+    try:
+        prompt_builder.compile_schema(schema)
+    except Exception as e:
+        logger.warning("Could not pre-compile schema '%s': %s", schema.get('schemaName'), e)
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """
+    Returns runtime counters for this worker process (connection pools and caches).
+    """
+    return jsonify({
+        "dbPool": db_pool.pool_stats(),
+        "llmClient": llm_client.stats(),
+        "sftpPool": sftp_pool.pool_stats(),
+        "schemaCache": schema_cache.stats(),
+        "translationCache": translation_cache.stats(),
+        "promptCache": prompt_builder.stats(),
+        "resultCache": result_cache.stats()
+    }), 200
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Latency histograms for this worker process (request phases and whole requests), in the Prometheus text format.
+    """
+    return Response(metrics.render(), status=200, content_type=metrics.CONTENT_TYPE)
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@app.route('/')
+def home():
+    """
+    Basic route to confirm the Flask backend is running.
+    """
+    return "Python Backend is Running!"
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    # Use environment variable for port, default to 5000 for local dev
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host='0.0.0.0', port=port, debug=False) # Set debug=False for production
+
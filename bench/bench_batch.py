@@ -0,0 +1,95 @@
+"""
+A dashboard of --items widgets loaded with one request per widget against one batch request.
+
+run-query: --items SELECTs as separate /api/run-query calls, then as one /api/run-query-batch
+in each mode. chat-query: --items questions as separate /api/chat-query calls (sequential, as a
+page without client-side fan-out would send them), then as one /api/chat-query-batch.
+The fake Postgres adds --connect-latency per new connection and the fake LLM --llm-latency per call.
+
+Usage: python bench/bench_batch.py [--items 8] [--requests 50] [--concurrency 1,4]
+                                   [--llm-latency 0.2] [--connect-latency 0.005]
+"""
+import argparse
+import contextlib
+import io
+import threading
+
+import requests
+
+import fakes
+from harness import format_row, run_load
+
+import app as backend
+import db_pool
+import translation_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=8, help="queries or questions per dashboard")
+    parser.add_argument("--requests", type=int, default=50, help="dashboard loads per run")
+    parser.add_argument("--concurrency", default="1,4")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--connect-latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    fakes.install_fake_postgres(rows=5000, connect_latency=args.connect_latency)
+    llm = fakes.FakeLLMServer(latency=args.llm_latency).start()
+    server, base_url = fakes.serve_app(backend.app)
+    credentials = fakes.FAKE_DB_CREDENTIALS
+    schema = fakes.make_schema(llm.url, credentials)
+    queries = [f"SELECT id, customer, amount FROM orders WHERE id % {args.items} = {i} LIMIT 100" for i in range(args.items)]
+    questions = [f"show orders for widget {i}" for i in range(args.items)]
+    local = threading.local()
+
+    def session():
+        if getattr(local, "session", None) is None:
+            local.session = requests.Session()
+        return local.session
+
+    def separate_queries():
+        return all(session().post(f"{base_url}/api/run-query", json={"dbCredentials": credentials, "query": query, "cache": False}).ok
+                   for query in queries)
+
+    def query_batch(mode):
+        def load():
+            response = session().post(f"{base_url}/api/run-query-batch", json={"dbCredentials": credentials, "queries": queries, "mode": mode})
+            return response.ok and all(item["status"] == 200 for item in response.json()["results"])
+        return load
+
+    def separate_chats():
+        return all(session().post(f"{base_url}/api/chat-query", json={"schema": schema, "query": question, "cache": False}).ok
+                   for question in questions)
+
+    def chat_batch():
+        response = session().post(f"{base_url}/api/chat-query-batch", json={"schema": schema, "queries": questions, "cache": False})
+        return response.ok and all(item["status"] == 200 for item in response.json()["results"])
+
+    paths = [
+        (f"{args.items} x run-query", separate_queries),
+        ("run-query-batch sequential", query_batch("sequential")),
+        ("run-query-batch transaction", query_batch("transaction")),
+        ("run-query-batch concurrent", query_batch("concurrent")),
+        (f"{args.items} x chat-query", separate_chats),
+        ("chat-query-batch", chat_batch),
+    ]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = []
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                for label, load in paths:
+                    db_pool.close_all() # Every path starts from cold connection pools
+                    translation_cache._cache.clear()
+                    total = args.requests if "chat" not in label else max(concurrency, args.requests // 5)
+                    rows.append((label, run_load(load, concurrency, total)))
+        print(f"{args.items} items per dashboard load; latencies are per load")
+        for label, result in rows:
+            print(format_row(label, result))
+        print("db pools:", db_pool.pool_stats())
+    finally:
+        server.shutdown()
+        llm.stop()
+
+
+if __name__ == '__main__':
+    main()
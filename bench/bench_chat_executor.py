@@ -0,0 +1,65 @@
+"""
+Compares /api/chat-query end to end with the generated SQL executed in-process (current code)
+against the old HTTP loopback to /api/run-query.
+
+The loopback mode is reproduced by swapping query_executor.execute_query for a wrapper that,
+only when called from chat_query, POSTs to /api/run-query and re-parses the JSON reply,
+exactly as chat_query used to. Everything else (fake LLM call, prompt building, pooling) is shared.
+
+Usage: python bench/bench_chat_executor.py [--requests 400] [--concurrency 1,8,32] [--llm-latency 0.0]
+"""
+import argparse
+
+import requests
+from flask import request as flask_request
+
+import fakes
+from harness import format_row, run_load
+
+import app as backend
+import query_executor
+import query_guard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the fake LLM waits before answering")
+    args = parser.parse_args()
+
+    fakes.install_fake_postgres(rows=1000)
+    llm = fakes.FakeLLMServer(latency=args.llm_latency).start()
+    server, base_url = fakes.serve_app(backend.app)
+    schema = fakes.make_schema(llm.url)
+
+    in_process_execute = query_executor.execute_query
+    loopback_session = requests.Session()
+
+    def loopback_execute(db_credentials, sql_query, policy=query_guard.DIRECT_POLICY):
+        if flask_request.path != '/api/chat-query':
+            return in_process_execute(db_credentials, sql_query, policy)
+        # The old loopback went through /api/run-query, so the chat policy could not travel with it
+        db_response = loopback_session.post(f"{base_url}/api/run-query", json={"dbCredentials": db_credentials, "query": sql_query})
+        return db_response.json(), db_response.status_code
+
+    client = requests.Session()
+
+    def chat():
+        response = client.post(f"{base_url}/api/chat-query", json={"query": "show me 50 orders", "schema": schema, "cache": False})
+        return response.status_code == 200
+
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            for label, execute in (("loopback (before)", loopback_execute), ("in-process (after)", in_process_execute)):
+                query_executor.execute_query = execute
+                run_load(chat, concurrency, min(20, args.requests))  # warm pools
+                print(format_row(label, run_load(chat, concurrency, args.requests)))
+    finally:
+        query_executor.execute_query = in_process_execute
+        server.shutdown()
+        llm.stop()
+
+
+if __name__ == '__main__':
+    main()
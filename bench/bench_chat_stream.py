@@ -0,0 +1,72 @@
+"""
+Time to first byte and total time of /api/chat-query, buffered versus "stream": true.
+
+The fake LLM streams one word every --token-delay seconds when asked to stream, or answers
+with the whole reply once it has produced every word. A plain-text reply shows the streaming
+win (the first token reaches the client after the first word); an SQL reply can only be
+executed once complete, so its first byte arrives with the 'sql' event at about the same time
+as the buffered answer.
+
+Usage: python bench/bench_chat_stream.py [--requests 20] [--words 60] [--token-delay 0.02]
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+import requests
+
+import fakes
+
+import app as backend
+
+
+def timed_chat(session, url, payload):
+    started = time.perf_counter()
+    with session.post(url, json=payload, stream=True) as response:
+        chunks = response.iter_content(chunk_size=None)
+        next(chunks)
+        first_byte = time.perf_counter() - started
+        for _ in chunks:
+            pass
+    return first_byte, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--words", type=int, default=60, help="words in the fake LLM's plain-text reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed words")
+    args = parser.parse_args()
+
+    text_reply = " ".join(["word"] * args.words)
+    sql_reply = "query -> SELECT id, customer, amount FROM orders WHERE status = 'open' ORDER BY id LIMIT 50"
+    replies = {"text": text_reply, "sql": sql_reply}
+
+    fakes.install_fake_postgres(rows=1000)
+    llm = fakes.FakeLLMServer(reply=lambda body: replies[body["messages"][0]["content"].rsplit(" ", 1)[-1]], token_delay=args.token_delay).start()
+    server, base_url = fakes.serve_app(backend.app)
+    schema = fakes.make_schema(llm.url)
+    session = requests.Session()
+
+    print(f"{'reply':<6} {'mode':<10} {'ttfb p50 ms':>12} {'total p50 ms':>13}")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = []
+            for kind in ("text", "sql"):
+                for stream in (False, True):
+                    payload = {"query": f"answer with {kind}", "schema": schema, "stream": stream, "cache": False}
+                    timings = [timed_chat(session, f"{base_url}/api/chat-query", payload) for _ in range(args.requests)]
+                    rows.append((kind, "stream" if stream else "buffered",
+                                 statistics.median(t[0] for t in timings) * 1000,
+                                 statistics.median(t[1] for t in timings) * 1000))
+        for kind, mode, ttfb, total in rows:
+            print(f"{kind:<6} {mode:<10} {ttfb:>12.1f} {total:>13.1f}")
+    finally:
+        server.shutdown()
+        llm.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the per-request CPU chat_query spends before calling the LLM.
+
+"rebuild" reproduces the original per-request work: joining every training example into the
+system prompt, json.loads of sampleJson, building headers and regex-parsing queryKey and
+responseKey. "rebuild+key" adds the translation-cache key the previous revision derived per
+request by serialising and hashing the schema fields and training set. "compiled" is the
+current path: prompt_builder.compile_schema (memo lookup and equality check), the
+translation-cache key from the compiled hashes, and CompiledSchema.build_request_body.
+
+Every call gets its own json.loads copy of the schema, as each request does, and only the call
+itself is timed. The speedup column compares "compiled" with the original "rebuild".
+
+Usage: python bench/bench_prompt_build.py [--sizes 10,100,500,2000] [--iterations 2000]
+"""
+import argparse
+import hashlib
+import json
+import re
+import time
+
+import fakes
+
+import prompt_builder
+import translation_cache
+
+
+def rebuild(schema, user_query):
+    llm_endpoint_config = schema['llmEndpoint']
+    training_examples = [f"Question: {ts['input']}\nSQL Query: {ts['output']}" for ts in schema.get("trainingSets", [])]
+    system_prompt = prompt_builder.build_system_prompt(schema.get("schemaName"), schema.get("Fields in database table"), training_examples)
+
+    headers = {'Content-Type': 'application/json'}
+    for header in llm_endpoint_config.get('extraHeaders', []):
+        headers[header['key']] = header['value']
+
+    llm_body_config = llm_endpoint_config.get('body', {})
+    request_body = json.loads(llm_body_config['sampleJson'])
+    query_key = llm_body_config['queryKey']
+    keys_list = [item for sublist in re.findall(r'(\w+)|\[(\d+)\]', query_key) for item in sublist if item]
+    target = request_body
+    for key_part in keys_list[:-1]:
+        target = target[int(key_part)] if key_part.isdigit() else target[key_part]
+    target[keys_list[-1]] = system_prompt + user_query
+    response_keys = [item for sublist in re.findall(r'(\w+)|\[(\d+)\]', llm_body_config['responseKey']) for item in sublist if item]
+    return request_body, headers, response_keys
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def rebuild_with_key(schema, user_query):
+    llm_endpoint_config = schema['llmEndpoint']
+    key = (
+        schema.get("schemaName"),
+        _digest({"fields": schema.get("Fields in database table"), "url": llm_endpoint_config.get('url'), "body": llm_endpoint_config.get('body')}),
+        _digest(schema.get("trainingSets") or []),
+        translation_cache.normalize_query(user_query),
+    )
+    return rebuild(schema, user_query), key
+
+
+def compiled(schema, user_query):
+    compiled_schema = prompt_builder.compile_schema(schema)
+    key = translation_cache.cache_key(compiled_schema, user_query)
+    return compiled_schema.build_request_body(compiled_schema.system_prompt + user_query), compiled_schema.headers, compiled_schema.response_path, key
+
+
+def per_call_us(fn, raw_schema, iterations):
+    fn(json.loads(raw_schema), "warm up")
+    elapsed = 0.0
+    for i in range(iterations):
+        schema = json.loads(raw_schema)
+        started = time.perf_counter()
+        fn(schema, f"how many orders on day {i}")
+        elapsed += time.perf_counter() - started
+    return elapsed / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,500,2000", help="training-set sizes to test")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'examples':>9} {'rebuild us/req':>15} {'rebuild+key us/req':>19} {'compiled us/req':>16} {'speedup vs rebuild':>19}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        schema = fakes.make_schema("http://127.0.0.1:9/v1", training_examples=size)
+        assert rebuild(schema, "q")[0] == compiled(schema, "q")[0]
+        raw_schema = json.dumps(schema)
+        original = per_call_us(rebuild, raw_schema, args.iterations)
+        with_key = per_call_us(rebuild_with_key, raw_schema, args.iterations)
+        after = per_call_us(compiled, raw_schema, args.iterations)
+        print(f"{size:>9} {original:>15.1f} {with_key:>19.1f} {after:>16.1f} {original / after:>18.1f}x")
+
+
+if __name__ == '__main__':
+    main()
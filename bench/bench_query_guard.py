@@ -0,0 +1,119 @@
+"""
+Latency of small /api/run-query lookups while other clients keep sending a runaway
+cross join, under different query_guard policies.
+
+"no guard" turns every check off. "row limit" appends LIMIT to the unbounded SELECT, "explain"
+rejects it from its row estimate before it runs, and "timeout" cancels it after --timeout-ms.
+Each runaway column shows how its requests ended (HTTP status: count) and how long they took.
+Before the runs, query_guard.with_row_limit is checked against ROW_LIMIT_CASES, e.g. that a
+SELECT ... INTO never gets a LIMIT (it would silently create a truncated table).
+
+Usage: python bench/bench_query_guard.py [--rows 600] [--requests 400] [--concurrency 8] [--runaway-clients 2]
+"""
+import argparse
+import collections
+import contextlib
+import io
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+import fakes
+from harness import format_row, run_load
+
+import app as backend
+import query_guard
+
+RUNAWAY_QUERY = "SELECT a.id, b.customer, a.amount FROM orders a, orders b"
+
+# (query, whether with_row_limit must append a LIMIT to it)
+ROW_LIMIT_CASES = [
+    ("SELECT * FROM orders", True),
+    ("WITH recent AS (SELECT * FROM orders) SELECT * FROM recent;", True),
+    ("SELECT * FROM orders LIMIT 5", False),
+    ("SELECT * FROM orders; DELETE FROM orders", False),
+    ("WITH gone AS (DELETE FROM orders RETURNING *) SELECT * FROM gone", False),
+    ("SELECT * INTO archive FROM orders", False),
+    ("select id, amount into temp recent_orders from orders", False),
+]
+
+
+def check_row_limit():
+    """
+    Exits with status 1 when with_row_limit limits a statement it must leave alone, or the reverse.
+    """
+    wrong = [(query, expected) for query, expected in ROW_LIMIT_CASES
+             if query_guard.with_row_limit(query, 1000)[1] != expected]
+    for query, expected in wrong:
+        print(f"FAIL with_row_limit({query!r}) should {'' if expected else 'not '}add a LIMIT")
+    if wrong:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=600, help="orders rows; the runaway query returns rows^2")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--runaway-clients", type=int, default=2)
+    parser.add_argument("--timeout-ms", type=int, default=100)
+    args = parser.parse_args()
+
+    check_row_limit()
+    fakes.install_fake_postgres(rows=args.rows)
+    server, base_url = fakes.serve_app(backend.app)
+    url = f"{base_url}/api/run-query"
+    credentials = fakes.FAKE_DB_CREDENTIALS
+    policy = query_guard.DIRECT_POLICY
+    policies = {
+        "no guard": dict(statement_timeout_ms=0, max_plan_rows=0, row_limit=0),
+        "row limit 1000": dict(statement_timeout_ms=0, max_plan_rows=0, row_limit=1000),
+        "explain rows <= 10000": dict(statement_timeout_ms=0, max_plan_rows=10000, row_limit=0),
+        f"timeout {args.timeout_ms} ms": dict(statement_timeout_ms=args.timeout_ms, max_plan_rows=0, row_limit=0),
+    }
+
+    small = requests.Session()
+    counter = iter(range(10 ** 9))
+
+    def lookup():
+        response = small.post(url, json={"dbCredentials": credentials, "query": f"SELECT * FROM orders WHERE id = {next(counter) % args.rows}"})
+        return response.status_code == 200
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = []
+            for label, settings in policies.items():
+                for name, value in settings.items():
+                    setattr(policy, name, value)
+                stop = threading.Event()
+                outcomes = collections.Counter()
+                runaway_seconds = []
+
+                def runaway():
+                    session = requests.Session()
+                    while not stop.is_set():
+                        started = time.perf_counter()
+                        response = session.post(url, json={"dbCredentials": credentials, "query": RUNAWAY_QUERY})
+                        runaway_seconds.append(time.perf_counter() - started)
+                        outcomes[response.status_code] += 1
+
+                threads = [threading.Thread(target=runaway) for _ in range(args.runaway_clients)]
+                for thread in threads:
+                    thread.start()
+                result = run_load(lookup, args.concurrency, args.requests)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                rows.append((label, result, dict(outcomes), statistics.median(runaway_seconds) * 1000 if runaway_seconds else 0.0))
+
+        for label, result, outcomes, runaway_ms in rows:
+            print(format_row(label, result) + f"  runaway {outcomes} p50={runaway_ms:.0f}ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+/api/run-query throughput for a dashboard re-running the same SELECTs, with the result cache
+off and on. --queries distinct statements are cycled, so every one after the first round is a hit.
+
+Usage: python bench/bench_result_cache.py [--rows 500] [--queries 20] [--requests 2000] [--concurrency 1,8]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import threading
+
+import requests
+
+import fakes
+from harness import format_row, run_load
+
+import app as backend
+import result_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500, help="rows returned by each dashboard query")
+    parser.add_argument("--queries", type=int, default=20, help="distinct dashboard queries")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", default="1,8")
+    args = parser.parse_args()
+
+    fakes.install_fake_postgres(rows=args.rows * 2)
+    server, base_url = fakes.serve_app(backend.app)
+    url = f"{base_url}/api/run-query"
+    queries = [f"SELECT id, customer, amount, status, created_at FROM orders WHERE id % {args.queries} != {i} LIMIT {args.rows}"
+               for i in range(args.queries)]
+    next_query = itertools.cycle(queries).__next__
+    local = threading.local()
+
+    def dashboard():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        response = session.post(url, json={"dbCredentials": fakes.FAKE_DB_CREDENTIALS, "query": next_query()})
+        return response.status_code == 200
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = []
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                for label, enabled in (("result cache off", False), ("result cache on", True)):
+                    result_cache.RESULT_CACHE_ENABLED = enabled
+                    result_cache._cache.clear()
+                    run_load(dashboard, concurrency, min(50, args.requests)) # warm pools
+                    rows.append((label, run_load(dashboard, concurrency, args.requests)))
+        for label, result in rows:
+            print(format_row(label, result))
+        print("cache:", result_cache.stats())
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
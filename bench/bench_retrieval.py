@@ -0,0 +1,78 @@
+"""
+Offline benchmark for training-example retrieval in chat prompts.
+
+For growing training-set sizes it reports the prompt size with every example pasted in versus
+only the top-k retrieved examples (tokens approximated as words and punctuation marks), the
+time to build the TF-IDF index once, and the per-question retrieval time.
+
+Usage: python bench/bench_retrieval.py [--sizes 10,100,500,2000,10000] [--top-k 8] [--queries 200]
+"""
+import argparse
+import random
+import re
+import time
+
+import fakes
+
+import example_retrieval
+import prompt_builder
+
+TABLES = ["orders", "customers", "invoices", "shipments", "products", "refunds", "payments", "reviews"]
+COLUMNS = ["status", "amount", "created_at", "region", "customer_id", "total", "currency", "channel"]
+PHRASES = [
+    "How many {t} have {c} set?",
+    "What is the average {c} of {t} last month?",
+    "List the top 10 {t} by {c}",
+    "Show {t} grouped by {c}",
+    "Which {t} had the highest {c} this week?",
+    "Count {t} per {c} for today",
+]
+
+
+def approx_tokens(text):
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def training_sets(size, rng):
+    examples = []
+    for i in range(size):
+        table, column = rng.choice(TABLES), rng.choice(COLUMNS)
+        question = rng.choice(PHRASES).format(t=table, c=column) + f" (variant {i})"
+        examples.append({"input": question, "output": f"SELECT {column}, COUNT(*) FROM {table} GROUP BY {column};"})
+    return examples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,500,2000,10000")
+    parser.add_argument("--top-k", type=int, default=example_retrieval.RETRIEVAL_TOP_K)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    questions = [rng.choice(PHRASES).format(t=rng.choice(TABLES), c=rng.choice(COLUMNS)) for _ in range(args.queries)]
+
+    print(f"{'examples':>9} {'full prompt tok':>16} {'top-k prompt tok':>17} {'index build ms':>15} {'query us':>9}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        schema = fakes.make_schema("http://127.0.0.1:9/v1")
+        schema["trainingSets"] = training_sets(size, rng)
+        examples = [prompt_builder.render_training_example(ts) for ts in schema["trainingSets"]]
+        full_prompt = prompt_builder.build_system_prompt("orders", schema["Fields in database table"], examples)
+
+        started = time.perf_counter()
+        index = example_retrieval.ExampleIndex([ts["input"] for ts in schema["trainingSets"]])
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        selections = [sorted(index.top_k(q, args.top_k)) for q in questions]
+        query_us = (time.perf_counter() - started) / len(questions) * 1e6
+
+        top_k_tokens = sum(
+            approx_tokens(prompt_builder.build_system_prompt("orders", schema["Fields in database table"], [examples[i] for i in selected]))
+            for selected in selections
+        ) / len(selections)
+        print(f"{size:>9} {approx_tokens(full_prompt):>16} {top_k_tokens:>17.0f} {build_ms:>15.2f} {query_us:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
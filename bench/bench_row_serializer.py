@@ -0,0 +1,89 @@
+"""
+Encoding a fetched result set into a JSON response body: the previous path (row dicts +
+Flask's default jsonify) against row_serializer with the standard library and with orjson.
+
+Each path ends with the Flask response object, as a view would return it.
+Rows are synthetic psycopg2 output for a typical orders table: int4, text, numeric,
+timestamptz, uuid, bool and a nullable text column. Peak memory is measured in a separate
+tracemalloc pass so it does not distort the timings.
+
+Usage: python bench/bench_row_serializer.py [--rows 100000] [--repeat 3]
+"""
+import argparse
+import datetime
+import decimal
+import time
+import tracemalloc
+import uuid
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import fakes # noqa: F401  (puts the repo root on sys.path)
+
+import row_serializer
+
+DESCRIPTION = [("id", 23), ("customer", 25), ("amount", 1700), ("created_at", 1184), ("ref", 2950), ("paid", 16), ("note", 25)]
+
+
+def make_rows(count):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        (i, f"customer-{i % 97}", decimal.Decimal(i * 137 % 50000) / 100, start + datetime.timedelta(minutes=i),
+         uuid.UUID(int=i), i % 2 == 0, None if i % 3 else "priority")
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    flask_app = Flask(__name__)
+    default_provider = DefaultJSONProvider(flask_app)
+    stdlib_provider = row_serializer.JSONProvider(flask_app)
+    stdlib_provider.use_orjson = False
+    orjson_provider = row_serializer.JSONProvider(flask_app)
+
+    def before():
+        column_names = [desc[0] for desc in DESCRIPTION]
+        return default_provider.response({"response": [dict(zip(column_names, row)) for row in rows]})
+
+    def with_provider(provider):
+        def encode():
+            # Converters are chosen for the backend in use, as execute_query would see them
+            row_serializer.USE_ORJSON = provider.use_orjson
+            return provider.response({"response": row_serializer.RowConverter(DESCRIPTION).dicts(rows)})
+        return encode
+
+    paths = [("dicts + jsonify (before)", before), ("row_serializer + json", with_provider(stdlib_provider))]
+    if row_serializer.orjson is not None:
+        paths.append(("row_serializer + orjson", with_provider(orjson_provider)))
+    else:
+        print("orjson is not installed; skipping the orjson backend")
+
+    print(f"{args.rows} rows x {len(DESCRIPTION)} columns")
+    print(f"{'path':<28} {'best ms':>9} {'rows/s':>12} {'body MB':>8} {'peak MB':>8}")
+    with flask_app.app_context():
+        for label, encode in paths:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = encode()
+                timings.append(time.perf_counter() - started)
+            body_size = len(response.get_data())
+            del response
+            tracemalloc.start()
+            response = encode()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del response
+            best = min(timings)
+            print(f"{label:<28} {best * 1000:>9.1f} {args.rows / best:>12,.0f} {body_size / 1e6:>8.1f} {peak / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures /api/get-schema latency against the in-process SFTP server with pooled sessions
+versus a fresh SSH handshake per request (the pre-pooling behaviour, reproduced by
+setting the pool's idle timeout to zero so every checkout starts a new session).
+The schema cache is kept at a zero TTL, so every request still goes to SFTP (a stat to
+revalidate) instead of being answered from memory.
+
+Usage: python bench/bench_sftp_pool.py [--requests 200] [--concurrency 1,4]
+"""
+import argparse
+
+import requests
+
+import fakes
+from harness import format_row, run_load
+
+import app as backend
+import schema_cache
+import sftp_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,4")
+    args = parser.parse_args()
+
+    sftp_server = fakes.FakeSFTPServer().start()
+    sftp_server.put_schema(fakes.make_schema("http://127.0.0.1:9/unused"))
+    server, base_url = fakes.serve_app(backend.app)
+    client = requests.Session()
+    payload = {"schemaName": "orders", "sftp": sftp_server.details}
+
+    def get_schema():
+        return client.post(f"{base_url}/api/get-schema", json=payload).status_code == 200
+
+    schema_cache._cache.clear()
+    schema_cache._cache.ttl = 0
+    pool = sftp_pool.get_pool(**sftp_server.details)
+    pooled_idle_timeout = pool.idle_timeout
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            for label, idle_timeout in (("handshake per request", 0), ("pooled sessions", pooled_idle_timeout)):
+                pool.idle_timeout = idle_timeout
+                before = sftp_server.handshakes
+                result = run_load(get_schema, concurrency, args.requests)
+                print(format_row(label, result) + f"  handshakes={sftp_server.handshakes - before}")
+    finally:
+        server.shutdown()
+        sftp_server.stop()
+
+
+if __name__ == '__main__':
+    main()
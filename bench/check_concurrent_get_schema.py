@@ -0,0 +1,92 @@
+"""
+Concurrency check for /api/get-schema: fires --concurrency simultaneous fetches of one schema
+from the in-process SFTP server, with the schema cache cleared before every round so each
+fetch reaches SFTP, and verifies that
+- every response is 200,
+- every body is identical to the schema document on the server,
+- no '*_temp.json' file appears in the working directory or the repo (get_schema used to
+  download through '{schemaName}_temp.json', which concurrent fetches raced on).
+Exits with status 1 and a list of failures otherwise.
+
+Usage: python bench/check_concurrent_get_schema.py [--concurrency 16] [--rounds 10] [--training-examples 500]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fakes
+
+import app as backend
+import schema_cache
+
+
+def temp_files():
+    found = set()
+    for directory in {os.getcwd(), fakes.REPO_ROOT}:
+        found.update(glob.glob(os.path.join(directory, "*_temp.json")))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--training-examples", type=int, default=500, help="makes the document span many SFTP reads")
+    args = parser.parse_args()
+
+    sftp_server = fakes.FakeSFTPServer().start()
+    schema = fakes.make_schema("http://127.0.0.1:9/unused", training_examples=args.training_examples)
+    sftp_server.put_schema(schema)
+    server, base_url = fakes.serve_app(backend.app)
+    payload = {"schemaName": schema["schemaName"], "sftp": sftp_server.details}
+    local = threading.local()
+    start = threading.Barrier(args.concurrency)
+
+    def fetch(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start.wait() # Release all fetches of a round at once
+        response = session.post(f"{base_url}/api/get-schema", json=payload, timeout=60)
+        return response.status_code, response.content
+
+    failures = []
+    temp_before = temp_files()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for round_number in range(args.rounds):
+                schema_cache._cache.clear()
+                results = list(executor.map(fetch, range(args.concurrency)))
+                statuses = [status for status, _ in results]
+                if any(status != 200 for status in statuses):
+                    failures.append(f"round {round_number}: statuses {statuses}")
+                    continue
+                bodies = {body for _, body in results}
+                if len(bodies) != 1:
+                    failures.append(f"round {round_number}: {len(bodies)} different bodies")
+                elif json.loads(bodies.pop()) != schema:
+                    failures.append(f"round {round_number}: body differs from the schema on the server")
+    finally:
+        server.shutdown()
+        sftp_server.stop()
+
+    new_temp_files = temp_files() - temp_before
+    if new_temp_files:
+        failures.append(f"temp files left behind: {sorted(new_temp_files)}")
+
+    print(f"{args.rounds} rounds x {args.concurrency} concurrent get-schema calls")
+    for failure in failures:
+        print("FAIL", failure)
+    if failures:
+        sys.exit(1)
+    print("OK: all 200, identical bodies matching the stored schema, no temp files")
+
+
+if __name__ == '__main__':
+    main()
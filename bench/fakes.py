@@ -0,0 +1,504 @@
+"""
+Local stand-ins for the services app.py talks to, used by the benchmark scripts.
+
+- install_fake_postgres(): points psycopg2.connect at a SQLite-backed fake.
+- FakeLLMServer: HTTP server that answers like an LLM endpoint after a configurable delay.
+- FakeSFTPServer: in-process paramiko SFTP server backed by a local directory.
+- serve_app(): runs a Flask app on a background werkzeug server.
+"""
+import json
+import os
+import re
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import paramiko
+import psycopg2
+from psycopg2 import extensions as psycopg2_extensions
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import query_guard
+
+FAKE_DB_CREDENTIALS = {
+    "host": "fake-postgres",
+    "port": 5432,
+    "user": "bench",
+    "password": "bench",
+    "database": "bench",
+}
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# SQLite-backed psycopg2 stand-in
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class FakeQueryCanceledError(psycopg2_extensions.QueryCanceledError):
+    pgcode = "57014"
+    pgerror = "ERROR:  canceling statement due to statement timeout"
+
+
+class FakeCursor:
+    """
+    Enough of a psycopg2 cursor for app.py: execute/fetch*, description, rowcount,
+    context-manager use and named (server-side) cursors, which SQLite simply runs client-side.
+    query_guard's preamble is understood too: SET LOCAL statement_timeout is enforced with a
+    SQLite progress handler, other SETs (and db_pool's DISCARD ALL) are ignored, and EXPLAIN (FORMAT JSON) returns a plan
+    whose "Plan Rows" is the statement's true row count and "Total Cost" the same number.
+    """
+
+    def __init__(self, conn, name=None):
+        self._conn = conn
+        self._cursor = conn._sqlite.cursor()
+        self._plan = None
+        self.name = name
+        self.itersize = 2000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def description(self):
+        if self._plan is not None:
+            return (("QUERY PLAN", None, None, None, None, None, None),)
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=None):
+        self._plan = None
+        if query.lstrip().upper().startswith(("SET ", "EXPLAIN ", "DISCARD ")):
+            self._execute_preamble(query, params)
+            return
+        timeout_ms = self._conn.statement_timeout_ms
+        if timeout_ms:
+            # Postgres computes a client-side cursor's whole result before answering, so the
+            # deadline also covers the fetches that follow, until the transaction ends.
+            deadline = time.monotonic() + timeout_ms / 1000
+            self._conn._sqlite.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        self._sqlite_call(self._cursor.execute, query, params or ())
+
+    def _sqlite_call(self, method, *args):
+        try:
+            return method(*args)
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                raise FakeQueryCanceledError() from e
+            raise psycopg2.ProgrammingError(str(e)) from e
+
+    def _execute_preamble(self, query, params):
+        params = list(params or [])
+        for statement in query.split("; "):
+            if statement.upper().startswith("SET LOCAL STATEMENT_TIMEOUT"):
+                self._conn.statement_timeout_ms = int(params.pop(0))
+            elif statement.upper().startswith("EXPLAIN (FORMAT JSON) "):
+                explained = statement[len("EXPLAIN (FORMAT JSON) "):].replace("%%", "%")
+                rows = 0
+                if query_guard.SELECT_RE.match(explained) and not query_guard.WRITE_KEYWORD_RE.search(explained):
+                    rows = self._conn._sqlite.execute(f"SELECT COUNT(*) FROM ({explained})").fetchone()[0]
+                self._plan = [{"Plan": {"Node Type": "Fake Scan", "Total Cost": float(rows), "Plan Rows": rows}}]
+
+    def fetchall(self):
+        if self._plan is not None:
+            return [(self._plan,)]
+        return self._sqlite_call(self._cursor.fetchall)
+
+    def fetchmany(self, size=None):
+        if self._plan is not None:
+            return [(self._plan,)]
+        return self._sqlite_call(self._cursor.fetchmany, size or self.itersize)
+
+    def fetchone(self):
+        if self._plan is not None:
+            return (self._plan,)
+        return self._sqlite_call(self._cursor.fetchone)
+
+    def close(self):
+        self._cursor.close()
+
+
+class FakeConnection:
+    def __init__(self, path):
+        self._sqlite = sqlite3.connect(path, check_same_thread=False)
+        self.closed = 0
+        self.autocommit = False
+        self.statement_timeout_ms = 0 # SET LOCAL: lasts until commit or rollback
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def commit(self):
+        self._sqlite.commit()
+        self._end_transaction()
+
+    def rollback(self):
+        self._sqlite.rollback()
+        self._end_transaction()
+
+    def _end_transaction(self):
+        if self.statement_timeout_ms:
+            self._sqlite.set_progress_handler(None, 0)
+            self.statement_timeout_ms = 0
+
+    def close(self):
+        if not self.closed:
+            self._sqlite.close()
+            self.closed = 1
+
+    def get_transaction_status(self):
+        if self._sqlite.in_transaction:
+            return psycopg2_extensions.TRANSACTION_STATUS_INTRANS
+        return psycopg2_extensions.TRANSACTION_STATUS_IDLE
+
+
+def create_orders_db(path, rows=1000):
+    """
+    Creates (or replaces) an 'orders' table with deterministic sample data.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE IF EXISTS orders")
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, customer TEXT, amount REAL, status TEXT, created_at TEXT)")
+    conn.executemany(
+        "INSERT INTO orders VALUES (?, ?, ?, ?, ?)",
+        [(i, f"customer-{i % 97}", round(i * 1.37 % 500, 2), ("open", "paid", "shipped")[i % 3], f"2024-01-{i % 28 + 1:02d}T12:00:00")
+         for i in range(rows)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def use_fake_postgres(path, connect_latency=0.0):
+    """
+    Replaces psycopg2.connect with a fake that opens the SQLite file at 'path'.
+    'connect_latency' simulates the TCP + TLS + auth handshake of a remote database.
+    """
+    connects = []
+
+    def connect(**kwargs):
+        if connect_latency:
+            time.sleep(connect_latency)
+        connects.append(time.monotonic())
+        return FakeConnection(path)
+
+    connect.connects = connects
+    psycopg2.connect = connect
+    return connect
+
+
+def install_fake_postgres(path=None, rows=1000, connect_latency=0.0):
+    """
+    Creates a SQLite database with sample orders and points psycopg2.connect at it.
+    Returns the SQLite file path.
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="bench_pg_", suffix=".sqlite3")
+        os.close(fd)
+    create_orders_db(path, rows)
+    use_fake_postgres(path, connect_latency)
+    return path
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Fake LLM endpoint
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class FakeLLMServer:
+    """
+    Answers POSTs with {"choices": [{"message": {"content": <reply>}}]} after 'latency' seconds.
+    'reply' is a string or a callable taking the decoded request body.
+    Requests with "stream": true get the reply as OpenAI-style server-sent events instead, one
+    word per chunk after 'latency', with 'token_delay' seconds between words. Buffered replies
+    take just as long to generate: they are sent once every word would have been streamed.
+    """
+
+    response_key = "choices.0.message.content"
+    stream_response_key = "choices.0.delta.content"
+
+    def __init__(self, reply="query -> SELECT id, customer, amount FROM orders LIMIT 50", latency=0.0, host="127.0.0.1", port=0, token_delay=0.0):
+        self.reply = reply
+        self.latency = latency
+        self.token_delay = token_delay
+        self.requests_served = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, keep-alive clients wait
+            # ~40ms for a delayed ACK before the body arrives, which a real LLM server would not add
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.latency:
+                    time.sleep(server.latency)
+                reply = server.reply(body) if callable(server.reply) else server.reply
+                if body.get("stream"):
+                    self._stream(reply)
+                    return
+                if server.token_delay:
+                    time.sleep(server.token_delay * (len(reply.split()) - 1))
+                payload = json.dumps({"choices": [{"message": {"content": reply}}]}).encode("utf-8")
+                server.requests_served += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, reply):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = re.findall(r"\S+\s*", reply)
+                for i, word in enumerate(words):
+                    if i and server.token_delay:
+                        time.sleep(server.token_delay)
+                    self._chunk(json.dumps({"choices": [{"delta": {"content": word}}]}))
+                self._chunk("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                server.requests_served += 1
+
+            def _chunk(self, data):
+                event = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://{host}:{self._httpd.server_address[1]}/v1/chat"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def make_schema(llm_url, db_credentials=None, training_examples=5, schema_name="orders"):
+    """
+    Builds a schema document in the shape save_schema stores and chat_query consumes.
+    """
+    return {
+        "schemaName": schema_name,
+        "Fields in database table": "id INTEGER, customer TEXT, amount REAL, status TEXT, created_at TEXT",
+        "trainingSets": [
+            {"input": f"How many orders does customer-{i} have?", "output": f"SELECT COUNT(*) FROM orders WHERE customer = 'customer-{i}';"}
+            for i in range(training_examples)
+        ],
+        "llmEndpoint": {
+            "url": llm_url,
+            "authType": "None",
+            "extraHeaders": [],
+            "body": {
+                "sampleJson": json.dumps({"model": "fake", "messages": [{"role": "user", "content": ""}]}),
+                "queryKey": "messages.0.content",
+                "responseKey": FakeLLMServer.response_key,
+                "streamResponseKey": FakeLLMServer.stream_response_key,
+                "streamKey": "stream",
+            },
+        },
+        "dbCredentials": dict(db_credentials or FAKE_DB_CREDENTIALS),
+    }
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# In-process SFTP server
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _PasswordServer(paramiko.ServerInterface):
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _LocalHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+def _rooted_sftp_interface(root):
+    """
+    Builds an SFTPServerInterface that maps remote absolute paths under 'root'.
+    """
+
+    class LocalDirSFTPServer(paramiko.SFTPServerInterface):
+        def _local(self, path):
+            return os.path.join(root, self.canonicalize(path).lstrip("/"))
+
+        def list_folder(self, path):
+            local = self._local(path)
+            try:
+                entries = []
+                for name in os.listdir(local):
+                    attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                    attr.filename = name
+                    entries.append(attr)
+                return entries
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+
+        def stat(self, path):
+            try:
+                return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+
+        lstat = stat
+
+        def open(self, path, flags, attr):
+            local = self._local(path)
+            try:
+                fd = os.open(local, flags | getattr(os, "O_BINARY", 0), 0o666)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            if flags & os.O_WRONLY:
+                mode = "ab" if flags & os.O_APPEND else "wb"
+            elif flags & os.O_RDWR:
+                mode = "a+b" if flags & os.O_APPEND else "r+b"
+            else:
+                mode = "rb"
+            handle = _LocalHandle(flags)
+            handle.filename = local
+            handle.readfile = handle.writefile = os.fdopen(fd, mode)
+            return handle
+
+        def remove(self, path):
+            try:
+                os.remove(self._local(path))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def rename(self, oldpath, newpath):
+            try:
+                os.rename(self._local(oldpath), self._local(newpath))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def mkdir(self, path, attr):
+            try:
+                os.mkdir(self._local(path))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def rmdir(self, path):
+            try:
+                os.rmdir(self._local(path))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+    return LocalDirSFTPServer
+
+
+class FakeSFTPServer:
+    """
+    Password-authenticated SFTP server on localhost serving files from 'root'
+    (a temporary directory by default). 'handshakes' counts accepted SSH connections.
+    """
+
+    def __init__(self, root=None, username="bench", password="bench", host="127.0.0.1", port=0):
+        self.root = root or tempfile.mkdtemp(prefix="bench_sftp_")
+        self.username = username
+        self.password = password
+        self.handshakes = 0
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._sftp_interface = _rooted_sftp_interface(self.root)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(128)
+        self.host = host
+        self.port = self._sock.getsockname()[1]
+        self._transports = []
+        self._running = False
+
+    @property
+    def details(self):
+        """
+        The 'sftp' object the schema endpoints expect.
+        """
+        return {"host": self.host, "port": self.port, "username": self.username, "password": self.password}
+
+    def put_schema(self, schema):
+        os.makedirs(os.path.join(self.root, "schemas"), exist_ok=True)
+        with open(os.path.join(self.root, "schemas", f"{schema['schemaName']}.json"), "w") as f:
+            json.dump(schema, f, indent=4)
+
+    def _serve(self):
+        while self._running:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self._host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, self._sftp_interface)
+            try:
+                transport.start_server(server=_PasswordServer(self.username, self.password))
+            except (paramiko.SSHException, EOFError, OSError):
+                continue
+            self.handshakes += 1
+            self._transports = [t for t in self._transports if t.is_active()] + [transport]
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Serving the Flask app
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def serve_app(flask_app, host="127.0.0.1", port=0):
+    """
+    Runs 'flask_app' on a threaded werkzeug server in the background.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server(host, port, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
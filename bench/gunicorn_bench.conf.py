@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for the benchmark scripts: the repo's gunicorn.conf.py plus optional
+local stand-ins installed in each worker.
+
+BENCH_FAKE_PG_PATH             path of a SQLite file to serve through the fake psycopg2.connect
+BENCH_FAKE_PG_CONNECT_LATENCY  seconds each new fake connection takes (default 0)
+"""
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(os.path.dirname(BENCH_DIR), "gunicorn.conf.py")) as f:
+    exec(compile(f.read(), "gunicorn.conf.py", "exec"))
+
+_repo_post_worker_init = post_worker_init
+
+
+def post_worker_init(worker):
+    _repo_post_worker_init(worker)
+    fake_pg_path = os.environ.get("BENCH_FAKE_PG_PATH")
+    if fake_pg_path:
+        sys.path.insert(0, BENCH_DIR)
+        import fakes
+        fakes.use_fake_postgres(fake_pg_path, float(os.environ.get("BENCH_FAKE_PG_CONNECT_LATENCY", 0)))
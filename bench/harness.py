@@ -0,0 +1,162 @@
+"""
+Small closed-loop load driver shared by the benchmark scripts, plus helpers for running the
+app under gunicorn and reading its workers' memory from /proc.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_load(call, concurrency, total_requests):
+    """
+    Calls 'call()' 'total_requests' times from 'concurrency' threads.
+    'call' returns True on success. Returns throughput and latency percentiles in ms.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                ok = call()
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "throughput": total_requests / wall if wall else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+    }
+
+
+def format_row(label, result):
+    return (f"{label:<28} c={result['concurrency']:<4} n={result['requests']:<6} err={result['errors']:<4} "
+            f"{result['throughput']:>9.1f} req/s  p50={result['p50']:>8.2f}ms  p95={result['p95']:>8.2f}ms  p99={result['p99']:>8.2f}ms")
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Gunicorn
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(worker_class, workers, port, extra_env=None):
+    """
+    Starts app:app under gunicorn with bench/gunicorn_bench.conf.py and waits until it answers.
+    Returns (process, base_url). Worker output goes to a temporary log file rather than a pipe,
+    so a chatty LOG_LEVEL can never fill a pipe nobody reads and stall the workers.
+    """
+    env = dict(os.environ, **(extra_env or {}))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    log = tempfile.NamedTemporaryFile(prefix="bench_gunicorn_", suffix=".log", delete=False)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(BENCH_DIR, "gunicorn_bench.conf.py"),
+         "-k", worker_class, "-w", str(workers), "-b", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    process.log_path = log.name
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(process.log_path, errors="replace") as f:
+                raise RuntimeError(f"gunicorn exited early: {f.read()}")
+        try:
+            if requests.get(base_url + "/", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not become ready within 30s (log: {process.log_path})")
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Memory from /proc (Linux)
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def child_pids(pid):
+    """
+    PIDs of the direct children of 'pid' (gunicorn's workers, for the master's PID).
+    """
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError: # Exited meanwhile
+            continue
+        # The command name is parenthesised and may contain spaces; the parent PID follows the state
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def memory_mb(pid):
+    """
+    (current RSS, peak RSS) of a process in MB, from /proc/<pid>/status; (0, 0) once it has exited.
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, kilobytes = line.split()[:2]
+                    values[key] = int(kilobytes) / 1024
+    except OSError:
+        pass
+    return values.get("VmRSS:", 0.0), values.get("VmHWM:", 0.0)
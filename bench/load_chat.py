@@ -0,0 +1,68 @@
+"""
+Load test for /api/chat-query under gunicorn against a fake LLM with fixed latency.
+
+For each worker class it starts gunicorn on the app, ramps concurrency and reports
+throughput and latency percentiles. With sync workers throughput is capped at
+workers / LLM latency; with gevent workers it keeps scaling with concurrency.
+
+Usage:
+  python bench/load_chat.py [--worker-classes sync,gevent] [--workers 2]
+                            [--concurrency 1,10,50,100,200] [--requests 400]
+                            [--llm-latency 0.5] [--sql]
+
+--sql makes the fake LLM answer with a query, so each chat also runs SQL against the
+SQLite-backed Postgres stand-in inside the gunicorn workers. Chats are sent with "cache": false,
+so the translation cache cannot answer them without the LLM call being measured.
+"""
+import argparse
+import threading
+
+import requests
+
+import fakes
+from harness import format_row, free_port, run_load, start_gunicorn, stop_gunicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-classes", default="sync,gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", default="1,10,50,100,200")
+    parser.add_argument("--requests", type=int, default=400, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--sql", action="store_true")
+    args = parser.parse_args()
+
+    reply = "query -> SELECT id, customer, amount FROM orders LIMIT 20" if args.sql else "Hello! Ask me about your orders."
+    llm = fakes.FakeLLMServer(reply=reply, latency=args.llm_latency).start()
+    schema = fakes.make_schema(llm.url)
+    env = {"PYTHONUNBUFFERED": "1"}
+    if args.sql:
+        env["BENCH_FAKE_PG_PATH"] = fakes.install_fake_postgres()
+
+    local = threading.local()
+
+    try:
+        for worker_class in args.worker_classes.split(","):
+            process, base_url = start_gunicorn(worker_class, args.workers, free_port(), env)
+            print(f"--- {worker_class} x {args.workers} workers, LLM latency {args.llm_latency}s ---")
+
+            def chat():
+                session = getattr(local, "session", None)
+                if session is None:
+                    session = local.session = requests.Session()
+                response = session.post(f"{base_url}/api/chat-query", json={"query": "how many orders today", "schema": schema, "cache": False}, timeout=120)
+                return response.status_code == 200
+
+            try:
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    total = max(args.requests, concurrency)
+                    print(format_row(worker_class, run_load(chat, concurrency, total)), flush=True)
+            finally:
+                stop_gunicorn(process)
+    finally:
+        llm.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Load-test suite: drives /api/get-schema, /api/save-schema, /api/chat-query and /api/run-query
+through the app under gunicorn, against local stand-ins for every service it talks to:
+- the in-process paramiko SFTP server from fakes.py, holding the schema store
+- the fake LLM HTTP server, answering after --llm-latency seconds
+- the SQLite-backed psycopg2 stand-in with --rows orders, installed in each gunicorn worker
+  (or a real Postgres given with --db-credentials; set DB_SSLMODE=disable for a local one)
+
+For every worker class, endpoint and concurrency level it reports throughput, p50/p95/p99
+latency and each worker's resident memory (current and peak, from /proc) after the run.
+
+--json-out writes the results to a file; --baseline compares against such a file and exits
+with status 1 when throughput dropped or p95 latency rose by more than --tolerance.
+
+Usage:
+  python bench/load_suite.py [--worker-classes sync] [--workers 2] [--concurrency 1,8,32]
+                             [--requests 300] [--endpoints get-schema,save-schema,chat-query,run-query]
+                             [--llm-latency 0.05] [--rows 1000] [--result-rows 100]
+                             [--json-out results.json] [--baseline results.json] [--tolerance 0.2]
+"""
+import argparse
+import itertools
+import json
+import sys
+import threading
+
+import requests
+
+import fakes
+from harness import child_pids, format_row, free_port, memory_mb, run_load, start_gunicorn, stop_gunicorn
+
+ENDPOINTS = ("get-schema", "save-schema", "chat-query", "run-query")
+
+
+def make_calls(base_url, sftp_server, schema, result_rows, run_name):
+    """
+    One request function per endpoint; each returns True when the request succeeded.
+    """
+    local = threading.local()
+    schema_names = (f"bench-{run_name}-{n}" for n in itertools.count()) # save-schema refuses to overwrite
+    next_schema_name = threading.Lock()
+    run_query_sql = f"SELECT id, customer, amount, status, created_at FROM orders LIMIT {result_rows}"
+
+    def post(path, payload):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        return session.post(f"{base_url}{path}", json=payload, timeout=120).status_code
+
+    def get_schema():
+        return post("/api/get-schema", {"schemaName": schema["schemaName"], "sftp": sftp_server.details}) == 200
+
+    def save_schema():
+        with next_schema_name:
+            name = next(schema_names)
+        return post("/api/save-schema", {
+            "sftp": sftp_server.details,
+            "name": name,
+            "Fields in database table": schema["Fields in database table"],
+            "trainingSets": schema["trainingSets"],
+            "llmEndpoint": schema["llmEndpoint"],
+            "dbCredentials": schema["dbCredentials"],
+        }) == 200
+
+    def chat_query():
+        # cache off: every request goes to the LLM and then runs the SQL it returns
+        return post("/api/chat-query", {"query": "list recent orders", "schema": schema, "cache": False}) == 200
+
+    def run_query():
+        return post("/api/run-query", {"dbCredentials": schema["dbCredentials"], "query": run_query_sql, "cache": False}) == 200
+
+    return {"get-schema": get_schema, "save-schema": save_schema, "chat-query": chat_query, "run-query": run_query}
+
+
+def worker_memory(process):
+    return [(pid, *memory_mb(pid)) for pid in child_pids(process.pid)]
+
+
+def format_memory(workers):
+    return "  rss " + " ".join(f"{rss:.0f}/{peak:.0f}MB" for _, rss, peak in workers)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lines describing every run that is worse than its baseline counterpart by more than 'tolerance'.
+    """
+    previous = {(r["workerClass"], r["endpoint"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["workerClass"], result["endpoint"], result["concurrency"]))
+        if before is None:
+            continue
+        label = f"{result['workerClass']} {result['endpoint']} c={result['concurrency']}"
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+        if result["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95']:.2f} -> {result['p95']:.2f} ms")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{label}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-classes", default="sync")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each run")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--db-connect-latency", type=float, default=0.005, help="seconds per new fake Postgres connection")
+    parser.add_argument("--rows", type=int, default=1000, help="rows in the fake orders table")
+    parser.add_argument("--result-rows", type=int, default=100, help="rows each run-query and chat-query SELECT returns")
+    parser.add_argument("--db-credentials", help="JSON dbCredentials of a real Postgres to use instead of the stand-in")
+    parser.add_argument("--json-out")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(",")
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    env = {}
+    if args.db_credentials:
+        db_credentials = json.loads(args.db_credentials)
+    else:
+        db_credentials = fakes.FAKE_DB_CREDENTIALS
+        env["BENCH_FAKE_PG_PATH"] = fakes.install_fake_postgres(rows=args.rows)
+        env["BENCH_FAKE_PG_CONNECT_LATENCY"] = str(args.db_connect_latency)
+
+    llm = fakes.FakeLLMServer(reply=f"query -> SELECT id, customer, amount FROM orders LIMIT {args.result_rows}",
+                              latency=args.llm_latency).start()
+    sftp_server = fakes.FakeSFTPServer().start()
+    schema = fakes.make_schema(llm.url, db_credentials)
+    sftp_server.put_schema(schema)
+
+    results = []
+    try:
+        for worker_class in args.worker_classes.split(","):
+            process, base_url = start_gunicorn(worker_class, args.workers, free_port(), env)
+            print(f"--- {worker_class} x {args.workers} workers, LLM latency {args.llm_latency}s ---", flush=True)
+            print(f"idle workers{format_memory(worker_memory(process))}", flush=True)
+            calls = make_calls(base_url, sftp_server, schema, args.result_rows, worker_class)
+            try:
+                for endpoint in endpoints:
+                    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                        run_load(calls[endpoint], concurrency, max(args.warmup, concurrency))
+                        result = run_load(calls[endpoint], concurrency, max(args.requests, concurrency))
+                        workers = worker_memory(process)
+                        print(format_row(f"{worker_class} {endpoint}", result) + format_memory(workers), flush=True)
+                        results.append({
+                            "workerClass": worker_class,
+                            "workers": args.workers,
+                            "endpoint": endpoint,
+                            **result,
+                            "workerRssMb": [round(rss, 1) for _, rss, _ in workers],
+                            "workerPeakRssMb": [round(peak, 1) for _, _, peak in workers],
+                        })
+            finally:
+                stop_gunicorn(process)
+    finally:
+        llm.stop()
+        sftp_server.stop()
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.json_out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
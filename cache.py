@@ -0,0 +1,159 @@
+"""
+Thread-safe LRU cache with per-entry TTL and optional byte budget, shared by the
+in-memory caches in this backend.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value, expires_at, size):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries go stale 'ttl' seconds after being set.
+    When 'max_bytes' is given, each entry's 'size' counts against it and the least
+    recently used entries are evicted until the total fits.
+    Stale entries stay in place (until evicted) so callers can revalidate them via get_entry().
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            key = next(iter(self._entries))
+            self._remove_locked(key)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value if present and fresh, counting a hit or miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def get_entry(self, key):
+        """
+        Returns (value, fresh) for a present entry, even a stale one, or None.
+        Does not touch the hit/miss counters; callers that revalidate record the outcome themselves.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry.value, entry.expires_at > now
+
+    def set(self, key, value, ttl=None, size=0):
+        """
+        Stores a value, evicting least recently used entries if the cache is over budget.
+        Values larger than the whole byte budget are not cached.
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.pop(key)
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = _Entry(value, expires_at, size)
+            self._bytes += size
+            self._evict_locked()
+
+    def touch(self, key, ttl=None):
+        """
+        Marks an entry fresh again for another TTL period.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = expires_at
+                self._entries.move_to_end(key)
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def pop(self, key):
+        """
+        Removes an entry, returning its value or None.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value = self._entries[key].value
+            self._remove_locked(key)
+            self.invalidations += 1
+            return value
+
+    def invalidate_where(self, predicate):
+        """
+        Removes every entry whose key satisfies 'predicate'. Returns how many were removed.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove_locked(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
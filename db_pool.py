@@ -0,0 +1,309 @@
+"""
+Process-wide PostgreSQL connection pools, one per resolved credential set.
+
+Each gunicorn worker builds its own pools lazily on the first request that needs
+them, so nothing is shared across the fork boundary.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions as psycopg2_extensions
+
+import metrics
+from pool_registry import PoolRegistry, password_digest
+
+# Pool tuning, overridable per deployment through environment variables.
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 0))            # connections kept open while idle, per credential set
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get("DB_POOL_IDLE_TIMEOUT", 300))          # seconds before an idle connection is closed
+DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", 10))   # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK_AFTER = float(os.environ.get("DB_POOL_HEALTH_CHECK_AFTER", 10))  # run SELECT 1 on checkout if idle longer than this
+DB_POOL_SWEEP_INTERVAL = float(os.environ.get("DB_POOL_SWEEP_INTERVAL", 60))       # seconds between sweeps of idle connections and unused pools
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")  # Often needed for cloud databases like Render
+
+
+class PoolTimeoutError(Exception):
+    """
+    Raised when no pooled connection becomes available within the checkout timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections for a single credential set.
+    Connections are validated on checkout and rolled back on return; after a committed statement
+    that may have changed session state they are also reset (DISCARD ALL).
+    """
+
+    def __init__(self, connect_kwargs, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 idle_timeout=DB_POOL_IDLE_TIMEOUT, checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT,
+                 health_check_after=DB_POOL_HEALTH_CHECK_AFTER):
+        self._connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, returned_at), most recently returned last
+        self._size = 0   # idle + checked out
+        self._closed = False
+        self.last_used = time.monotonic() # Last get_pool() for this pool; see sweep()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+        self.evictions = 0
+        self.session_resets = 0
+
+    def _evict_idle_locked(self, now):
+        """
+        Closes connections that have sat idle past the idle timeout, keeping min_size open.
+        Must be called with the pool lock held.
+        """
+        while self._idle and self._size > self.min_size:
+            conn, returned_at = self._idle[0]
+            if now - returned_at < self.idle_timeout:
+                break
+            self._idle.pop(0)
+            self._size -= 1
+            self.evictions += 1
+            _close_quietly(conn)
+
+    def sweep(self, now):
+        """
+        Evicts expired idle connections. Returns True when the pool holds no connections and
+        has not been asked for within the idle timeout, i.e. it can be dropped.
+        """
+        with self._cond:
+            self._evict_idle_locked(now)
+            return self._size == 0 and now - self.last_used >= self.idle_timeout
+
+    def _is_healthy(self, conn, returned_at):
+        """
+        Checks a connection taken from the idle list before handing it out.
+        """
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2_extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """
+        Checks out a connection, reusing an idle one when possible.
+        Blocks up to checkout_timeout when the pool is at max_size.
+        """
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool has been closed.")
+                while True:
+                    now = time.monotonic()
+                    self._evict_idle_locked(now)
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        conn = None
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.checkout_timeout:.1f}s "
+                            f"(pool max size {self.max_size})."
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if waited:
+                    wait_time = time.monotonic() - started
+                    self.waits += 1
+                    self.wait_time_total += wait_time
+                    self.wait_time_max = max(self.wait_time_max, wait_time)
+                    waited = False
+
+            if conn is None:
+                try:
+                    with metrics.phase(metrics.DB_CONNECT):
+                        conn = psycopg2.connect(**self._connect_kwargs)
+                except Exception:
+                    self._release_slot()
+                    with self._cond:
+                        never_connected = self.misses == 0 and self._size == 0
+                    if never_connected:
+                        _registry.forget(self)
+                    raise
+                with self._cond:
+                    self.misses += 1
+                metrics.observe_phase(metrics.DB_CHECKOUT, time.monotonic() - started)
+                return conn
+
+            if self._is_healthy(conn, returned_at):
+                with self._cond:
+                    self.hits += 1
+                metrics.observe_phase(metrics.DB_CHECKOUT, time.monotonic() - started)
+                return conn
+
+            # Stale connection: drop it and try again with the freed slot.
+            _close_quietly(conn)
+            with self._cond:
+                self.health_check_failures += 1
+            self._release_slot()
+
+    def putconn(self, conn, reset=False):
+        """
+        Returns a connection to the pool, rolling back any open transaction first.
+        With 'reset', session state a committed statement may have left behind (SET search_path,
+        SET ROLE, temp tables, prepared statements, advisory locks) is discarded too, so the next
+        request sharing the credential set starts from a fresh session.
+        Broken connections are discarded instead of being reused.
+        """
+        reusable = not conn.closed
+        if reusable:
+            try:
+                conn.rollback()
+                if reset:
+                    self._reset_session(conn)
+            except psycopg2.Error:
+                reusable = False
+
+        with self._cond:
+            if reusable and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        _close_quietly(conn)
+        self._release_slot()
+
+    def _reset_session(self, conn):
+        # DISCARD ALL cannot run inside a transaction block, which psycopg2 would otherwise open
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DISCARD ALL")
+        finally:
+            conn.autocommit = False
+        with self._cond:
+            self.session_resets += 1
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager wrapping getconn/putconn.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        """
+        Closes every idle connection; checked-out ones are closed when returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "inUse": self._size - len(self._idle),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "waitTimeTotal": round(self.wait_time_total, 6),
+                "waitTimeMax": round(self.wait_time_max, 6),
+                "timeouts": self.timeouts,
+                "healthCheckFailures": self.health_check_failures,
+                "evictions": self.evictions,
+                "sessionResets": self.session_resets,
+            }
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_registry = PoolRegistry("db-pool", DB_POOL_SWEEP_INTERVAL)
+
+
+def pool_key(host, port, user, password, database):
+    """
+    Identity of the pool a credential set maps to; also keys per-pool state elsewhere (result_cache).
+    """
+    return (host, str(port), user, database, password_digest(password))
+
+
+def get_pool(host, port, user, password, database):
+    """
+    Returns the process-wide pool for a credential set, creating it on first use.
+    """
+    return _registry.get(pool_key(host, port, user, password, database), lambda: ConnectionPool({
+        "host": host,
+        "port": port,
+        "user": user,
+        "password": password,
+        "database": database,
+        "sslmode": DB_SSLMODE,
+    }))
+
+
+def sweep():
+    """
+    Closes expired idle connections in every pool and drops pools left empty and unused.
+    """
+    _registry.sweep()
+
+
+def pool_stats():
+    """
+    Snapshot of every pool in this process, without credentials.
+    """
+    return [
+        {"host": host, "port": port, "user": user, "database": database, **pool.stats()}
+        for (host, port, user, database, _), pool in _registry.items()
+    ]
+
+
+def close_all():
+    """
+    Closes and forgets every pool in this process.
+    """
+    _registry.close_all()
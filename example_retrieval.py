@@ -0,0 +1,83 @@
+"""
+Local TF-IDF retrieval over a schema's training questions.
+
+chat_query used to paste every training example into the system prompt. For large training
+sets ExampleIndex picks the top-k examples most similar to the user's question instead, so
+prompt size stays flat as the training set grows. Everything runs in-process; indexes are
+built once per compiled schema (see prompt_builder) and reused across requests.
+"""
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 8)) # 0 disables retrieval and sends every example
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text):
+    """
+    Lower-cased word unigrams plus adjacent-word bigrams.
+    """
+    words = TOKEN_RE.findall(str(text).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class ExampleIndex:
+    """
+    Inverted index of L2-normalised TF-IDF vectors, one document per training question.
+    """
+
+    def __init__(self, questions):
+        self.size = len(questions)
+        doc_terms = [Counter(tokenize(q)) for q in questions]
+        document_frequency = Counter(term for terms in doc_terms for term in terms)
+        self.idf = {term: math.log((1 + self.size) / (1 + df)) + 1.0 for term, df in document_frequency.items()}
+
+        self.postings = defaultdict(dict) # term -> {doc_id: weight}
+        for doc_id, terms in enumerate(doc_terms):
+            weights = {term: (1 + math.log(count)) * self.idf[term] for term, count in terms.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, weight in weights.items():
+                self.postings[term][doc_id] = weight / norm
+        # Terms in more documents than this ("how", "many", the table name...) only re-rank
+        # candidates found through rarer terms, so query time tracks the rare postings, not the corpus.
+        self.common_term_cutoff = max(64, self.size // 20)
+
+    def top_k(self, query, k):
+        """
+        Returns the ids of up to k most similar documents, best first.
+        When fewer than k documents share a term with the query, the earliest documents fill
+        the remaining slots so the prompt still shows the LLM some examples.
+        """
+        if k >= self.size:
+            return list(range(self.size))
+
+        query_terms = Counter(term for term in tokenize(query) if term in self.idf)
+        scores = defaultdict(float)
+        if query_terms:
+            weights = {term: (1 + math.log(count)) * self.idf[term] for term, count in query_terms.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values()))
+            rare = [term for term in weights if len(self.postings[term]) <= self.common_term_cutoff]
+            common = [term for term in weights if len(self.postings[term]) > self.common_term_cutoff]
+            for term in rare or common:
+                query_weight = weights[term] / norm
+                for doc_id, doc_weight in self.postings[term].items():
+                    scores[doc_id] += query_weight * doc_weight
+            if rare:
+                for term in common:
+                    query_weight = weights[term] / norm
+                    postings = self.postings[term]
+                    for doc_id in scores:
+                        doc_weight = postings.get(doc_id)
+                        if doc_weight:
+                            scores[doc_id] += query_weight * doc_weight
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        selected = [doc_id for doc_id, _ in best]
+        if len(selected) < k:
+            chosen = set(selected)
+            selected += [doc_id for doc_id in range(self.size) if doc_id not in chosen][:k - len(selected)]
+        return selected
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn is started from this directory.
+
+By default workers stay synchronous. Set GUNICORN_WORKER_CLASS=gevent (or pass -k gevent) to
+serve requests from greenlets instead: the LLM call in chat_query, SFTP traffic and database
+queries then yield while waiting on the network, so one worker process can hold hundreds of
+in-flight chats instead of one per OS thread. Do not combine gevent workers with --preload,
+since the app must be imported after gevent has patched the standard library.
+"""
+import os
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000)) # Max concurrent clients per gevent worker
+
+
+def post_worker_init(worker):
+    """
+    Makes psycopg2 cooperative under gevent; without this every query blocks the whole worker.
+    """
+    if "gevent" not in worker.cfg.worker_class_str:
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        worker.log.warning("psycogreen is not installed; database queries will block the gevent worker.")
+        return
+    patch_psycopg()
+    worker.log.info("psycopg2 patched for gevent.")
@@ -0,0 +1,182 @@
+"""
+Shared HTTP client for LLM endpoint calls.
+
+One requests.Session per LLM base URL keeps connections alive across chats. Every call
+has connect/read timeouts, 429/5xx responses and connect failures are retried with
+backoff, and a per-endpoint circuit breaker fails fast while an endpoint is down.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))      # seconds to establish a connection
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 120))          # seconds to wait for response bytes
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", 0.5))        # backoff factor: 0.5s, 1s, 2s, ...
+LLM_MAX_RETRY_AFTER = float(os.environ.get("LLM_MAX_RETRY_AFTER", 2))      # longest Retry-After wait honoured between retries
+LLM_POOL_MAXSIZE = int(os.environ.get("LLM_POOL_MAXSIZE", 32))             # keep-alive connections per endpoint
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", 5))  # consecutive failures before opening
+LLM_CIRCUIT_RESET_TIMEOUT = float(os.environ.get("LLM_CIRCUIT_RESET_TIMEOUT", 30))       # seconds open before a trial request
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an LLM endpoint whose circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after 'failure_threshold' consecutive failures and rejects calls for
+    'reset_timeout' seconds; then lets a single trial call through (half-open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=LLM_CIRCUIT_FAILURE_THRESHOLD, reset_timeout=LLM_CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opens = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before_request(self, endpoint):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"LLM endpoint {endpoint} is unavailable after repeated failures; retrying in {retry_in:.0f}s.")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+class _CappedRetry(Retry):
+    """
+    Retry that honours Retry-After only up to LLM_MAX_RETRY_AFTER seconds, so an endpoint asking
+    for minutes of back-off cannot hold a worker for that long; the breaker handles longer outages.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, LLM_MAX_RETRY_AFTER)
+
+
+class _Endpoint:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        retry = _CappedRetry(
+            total=LLM_MAX_RETRIES,
+            connect=LLM_MAX_RETRIES,
+            read=0, # A read timeout means the LLM is slow, not down; retrying would only multiply the wait
+            status=LLM_MAX_RETRIES,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None, # Retry POSTs too: LLM completions have no side effects
+            backoff_factor=LLM_RETRY_BACKOFF,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_MAXSIZE, max_retries=retry)
+        self.session.mount(base_url, adapter)
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.failures = 0
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def _endpoint_for(url):
+    parts = urlsplit(url)
+    base_url = f"{parts.scheme}://{parts.netloc}/"
+    with _endpoints_lock:
+        endpoint = _endpoints.get(base_url)
+        if endpoint is None:
+            endpoint = _Endpoint(base_url)
+            _endpoints[base_url] = endpoint
+        return endpoint
+
+
+def post(url, headers, json_body, stream=False):
+    """
+    POSTs a JSON body to an LLM endpoint over the shared session and returns the Response.
+    Raises CircuitOpenError without sending anything while the endpoint's breaker is open,
+    and the usual requests exceptions on connection errors or timeouts.
+    """
+    endpoint = _endpoint_for(url)
+    endpoint.breaker.before_request(endpoint.base_url)
+    endpoint.requests += 1
+    try:
+        response = endpoint.session.post(
+            url,
+            headers=headers,
+            json=json_body,
+            timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+            stream=stream,
+        )
+    except requests.exceptions.RequestException:
+        endpoint.failures += 1
+        endpoint.breaker.record_failure()
+        raise
+    if response.status_code >= 500 or response.status_code == 429: # Still failing once retries are used up
+        endpoint.failures += 1
+        endpoint.breaker.record_failure()
+    else:
+        endpoint.breaker.record_success()
+    return response
+
+
+def stats():
+    """
+    Per-endpoint request counts and circuit breaker state for this process.
+    """
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return [
+        {
+            "endpoint": endpoint.base_url,
+            "requests": endpoint.requests,
+            "failures": endpoint.failures,
+            "circuitState": endpoint.breaker.state,
+            "circuitOpens": endpoint.breaker.opens,
+            "rejected": endpoint.breaker.rejected,
+        }
+        for endpoint in endpoints
+    ]
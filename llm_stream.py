@@ -0,0 +1,96 @@
+"""
+Incremental reading of streamed LLM replies for chat_query's streaming mode.
+
+LLM endpoints stream either server-sent events (OpenAI style 'data: {...}' lines, ending with
+'data: [DONE]') or newline-delimited JSON (Ollama style). iter_text() yields the text pieces
+from either, and falls back to the whole reply when the endpoint answers with one JSON document.
+ReplySplitter decides from the first few characters whether a reply is SQL (SQL_PREFIX) or
+plain text, so plain text can be forwarded to the client before the LLM has finished.
+"""
+import json
+
+from prompt_builder import get_nested_value
+
+SQL_PREFIX = "query -> "
+DONE_MARKER = b"[DONE]"
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+def _piece(document, path):
+    """
+    Text carried by one stream chunk. Chunks without text (role headers, finish reasons) are normal.
+    """
+    value = get_nested_value(document, path)
+    if not isinstance(value, str) or value == 'No response content found.':
+        return ""
+    return value
+
+
+def iter_text(response, stream_path, response_path):
+    """
+    Yields the reply text of a requests Response opened with stream=True, piece by piece.
+    'stream_path' locates the text in each streamed chunk, 'response_path' in a non-streamed reply.
+    """
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+    if content_type == "text/event-stream":
+        # chunk_size=None hands lines over as each HTTP chunk arrives instead of waiting for a full buffer
+        for line in response.iter_lines(chunk_size=None):
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == DONE_MARKER:
+                return
+            if payload:
+                yield _piece(json.loads(payload), stream_path)
+        return
+
+    if content_type in NDJSON_TYPES:
+        for line in response.iter_lines(chunk_size=None):
+            if line.strip():
+                yield _piece(json.loads(line), stream_path)
+        return
+
+    # The endpoint ignored the stream flag and sent one document: behave like the buffered path.
+    text = get_nested_value(response.json(), response_path)
+    yield text if isinstance(text, str) else str(text)
+
+
+class ReplySplitter:
+    """
+    Classifies a streamed reply as SQL or plain text as early as its first characters allow.
+    feed() returns the text that can be forwarded right away: nothing while the start of the reply
+    could still be SQL_PREFIX, then every plain-text piece as it arrives. SQL replies are held
+    back whole and returned by finish() once the stream has ended.
+    """
+
+    def __init__(self, prefix=SQL_PREFIX):
+        self.prefix = prefix.lower()
+        self.mode = None # None until decided, then "sql" or "text"
+        self._pending = []
+
+    def feed(self, piece):
+        if self.mode == "text":
+            return piece
+        self._pending.append(piece)
+        if self.mode == "sql":
+            return ""
+        head = "".join(self._pending).lstrip().lower()
+        if head.startswith(self.prefix):
+            self.mode = "sql"
+            return ""
+        if self.prefix.startswith(head):
+            return "" # Still ambiguous, e.g. "quer"
+        self.mode = "text"
+        text = "".join(self._pending)
+        self._pending = []
+        return text
+
+    def finish(self):
+        """
+        Returns (mode, text) for the part of the reply not yet forwarded.
+        A reply that ended while still ambiguous is plain text.
+        """
+        text = "".join(self._pending)
+        self._pending = []
+        return ("sql" if self.mode == "sql" else "text"), text
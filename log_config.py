@@ -0,0 +1,48 @@
+"""
+Logging setup for the backend.
+
+LOG_LEVEL (default INFO) gates what is emitted; per-request chatter such as SQL text and LLM
+payloads is only logged at DEBUG. LOG_FORMAT=json writes one JSON object per line, carrying
+any 'extra' fields (e.g. a request's phase timings) as top-level keys for log pipelines.
+"""
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower() # 'text' or 'json'
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else on a record came from 'extra'.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure():
+    """
+    Installs a stderr handler on the root logger, unless one is configured already
+    (e.g. by gunicorn's --log-config), and applies LOG_LEVEL.
+    """
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
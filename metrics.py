@@ -0,0 +1,133 @@
+"""
+Latency histograms for this worker process, exported in the Prometheus text format on /metrics.
+
+Code paths time themselves with phase("llm_call") (or observe_phase when the duration is
+already known). Each observation lands in backend_phase_seconds{phase=...} and, while a request
+is being handled, in that request's phase breakdown, which app.py logs when the request ends.
+Like /api/stats, every gunicorn worker keeps its own numbers; scrape each worker or sum them.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Phases timed across the request path.
+SFTP_CONNECT = "sftp_connect"
+SCHEMA_DOWNLOAD = "schema_download"
+PROMPT_BUILD = "prompt_build"
+LLM_CALL = "llm_call"
+DB_CHECKOUT = "db_checkout"
+DB_CONNECT = "db_connect"
+QUERY_EXECUTE = "query_execute"
+SERIALIZE = "serialize"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with one series per combination of label values.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """
+        Lines of the Prometheus text exposition format for this histogram.
+        """
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in sorted(self._series.items())]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, counts, total, count in snapshot:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format_number(upper)}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total!r}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+PHASE_SECONDS = Histogram("backend_phase_seconds", "Time spent in each phase of request handling.", ("phase",))
+REQUEST_SECONDS = Histogram("backend_request_seconds", "Time to handle an HTTP request, until the response is returned.",
+                            ("endpoint", "method", "status"))
+
+_request_phases = contextvars.ContextVar("request_phases", default=None)
+# A request's phase dict is shared with the threads its work fans out to (copy_context).
+_phases_lock = threading.Lock()
+
+
+def observe_phase(name, seconds):
+    PHASE_SECONDS.observe(seconds, name)
+    phases = _request_phases.get()
+    if phases is not None:
+        with _phases_lock:
+            phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the enclosed block as phase 'name', whether or not it raises.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(name, time.perf_counter() - started)
+
+
+def start_request():
+    """
+    Starts collecting a phase breakdown for the current request.
+    """
+    _request_phases.set({})
+
+
+def end_request(endpoint, method, status, seconds):
+    """
+    Records the request duration and returns its {phase: seconds} breakdown.
+    Phases that run later, e.g. while a streamed body is sent, still reach the histograms.
+    """
+    REQUEST_SECONDS.observe(seconds, endpoint, method, str(status))
+    phases = _request_phases.get() or {}
+    _request_phases.set(None)
+    with _phases_lock:
+        return dict(phases)
+
+
+def render():
+    """
+    The whole /metrics page.
+    """
+    lines = PHASE_SECONDS.render() + REQUEST_SECONDS.render()
+    return "\n".join(lines) + "\n"
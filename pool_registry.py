@@ -0,0 +1,103 @@
+"""
+Process-wide registry of keyed connection pools, shared by db_pool and sftp_pool.
+
+A PoolRegistry creates pools on first use and runs a background sweeper that asks every pool
+to close its expired idle connections and drops pools left empty and unused, so credential sets
+that stop getting traffic release their connections. Pools it holds provide:
+- last_used: monotonic time of the last get(), set by the registry
+- sweep(now): evicts expired idle connections; True when the pool can be dropped
+- close(): closes idle connections; checked-out ones are closed when returned
+"""
+import hashlib
+import os
+import threading
+import time
+
+
+def password_digest(password):
+    """
+    Stands in for a password in pool and cache keys, so a caller with a different password never
+    gets a connection (or a cached document) obtained with someone else's.
+    """
+    return hashlib.sha256(str(password).encode("utf-8")).hexdigest()
+
+
+class PoolRegistry:
+    """
+    Pools by key, swept every 'sweep_interval' seconds (0 disables the sweeper).
+    """
+
+    def __init__(self, name, sweep_interval):
+        self.name = name
+        self.sweep_interval = sweep_interval
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+
+    def get(self, key, create):
+        """
+        Returns the pool for 'key', calling create() to build it on first use.
+        """
+        with self._lock:
+            self._start_sweeper_locked()
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = create()
+                self._pools[key] = pool
+            pool.last_used = time.monotonic() # Under the registry lock, so a sweep cannot drop it now
+            return pool
+
+    def forget(self, pool):
+        """
+        Removes a pool from the registry (if still registered) and closes it, e.g. after its
+        first connection failed on a wrong password, so failed attempts do not each keep a pool.
+        """
+        with self._lock:
+            for key, registered in list(self._pools.items()):
+                if registered is pool:
+                    del self._pools[key]
+        pool.close()
+
+    def sweep(self):
+        """
+        Sweeps every pool and drops (and closes) those left empty and unused.
+        """
+        now = time.monotonic()
+        with self._lock:
+            unused = [(key, pool) for key, pool in self._pools.items() if pool.sweep(now)]
+            for key, _ in unused:
+                del self._pools[key]
+        for _, pool in unused:
+            pool.close()
+
+    def items(self):
+        """
+        Snapshot of the registered (key, pool) pairs.
+        """
+        with self._lock:
+            return list(self._pools.items())
+
+    def close_all(self):
+        """
+        Closes and forgets every pool.
+        """
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                pass # Never let the sweeper die; the next round retries
+
+    def _start_sweeper_locked(self):
+        # Started lazily and once per process, so every forked gunicorn worker gets its own
+        if self._sweeper_pid == os.getpid() or self.sweep_interval <= 0:
+            return
+        self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_forever, name=f"{self.name}-sweeper", daemon=True).start()
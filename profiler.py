@@ -0,0 +1,67 @@
+"""
+Opt-in sampling profiler for requests.
+
+With PROFILE_SAMPLE_RATE above 0, that fraction of requests runs under cProfile. Each profile
+is written to PROFILE_DIR as a pstats file (open it with `python -m pstats` or snakeviz) and
+its top functions by cumulative time are logged at DEBUG level. Only one request per process
+is profiled at a time, since the profiler hooks the whole interpreter on newer Pythons.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0)) # e.g. 0.01 profiles 1% of requests
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "backend-profiles"))
+PROFILE_TOP_FUNCTIONS = int(os.environ.get("PROFILE_TOP_FUNCTIONS", 25))
+
+logger = logging.getLogger(__name__)
+
+_active = threading.Lock()
+
+
+def start():
+    """
+    Returns a running cProfile.Profile if this request was sampled, else None.
+    """
+    if not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _active.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError: # Another profiler (a debugger, coverage) already holds the hook
+        _active.release()
+        return None
+    return profile
+
+
+def stop(profile, label):
+    """
+    Stops a profile from start() and writes it to PROFILE_DIR. Returns the file path, or None
+    when the file could not be written; that is logged and never fails the request.
+    """
+    profile.disable()
+    _active.release()
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "request"
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile.dump_stats(path)
+    except OSError as e:
+        logger.warning("Could not write profile of %s to %s: %s", label, path, e)
+        return None
+    if logger.isEnabledFor(logging.DEBUG):
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        logger.debug("Profile of %s written to %s\n%s", label, path, report.getvalue())
+    else:
+        logger.info("Profile of %s written to %s", label, path)
+    return path
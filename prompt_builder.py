@@ -0,0 +1,292 @@
+"""
+Per-schema compiled artifacts for chat_query.
+
+compile_schema() turns a schema document into everything the LLM call needs that does not
+depend on the user's question: the system prompt, request headers, the parsed sampleJson
+body template and the pre-parsed queryKey / responseKey paths. Results are memoised by the
+schema's content, so repeated chats against the same schema only pay for a dict lookup and an
+equality check instead of rebuilding the prompt, re-parsing sampleJson and re-running the key
+path regexes.
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+
+from cache import TTLCache
+from example_retrieval import RETRIEVAL_TOP_K, ExampleIndex
+
+PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get("PROMPT_CACHE_MAX_ENTRIES", 128))
+PROMPT_CACHE_VARIANTS = int(os.environ.get("PROMPT_CACHE_VARIANTS", 4)) # Compiled versions kept per schema name and fields
+
+PROMPT_RULES = """Your job:
+- Convert user questions into valid SQL queries using the schema and training examples.
+- Always return only the SQL query unless the user is just greeting you.
+Special rules:
+- If the user says "hi", "hello", "hey", or similar greetings, respond politely with a short friendly greeting.
+- If the user asks about anything outside SQL queries (e.g., coding, stories, general knowledge), reply only with:
+ "I am not trained for this"
+- If the user asked questions related to the database and you are able to create a query, then return your response prefixed with "query -> " followed by the SQL query.
+Example: "query -> SELECT * FROM customers WHERE total_orders > 10;"
+If you cannot make the query (e.g., for greetings, "not trained", or "cannot provide") then return your response as a simple string without any prefix.
+"""
+
+_compiled = TTLCache(max_entries=PROMPT_CACHE_MAX_ENTRIES, ttl=float("inf"))
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Key Paths
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@lru_cache(maxsize=1024)
+def parse_key_path(keys):
+    """
+    Splits a key path like 'messages.0.content' or 'parts[0].text' into its segments.
+    """
+    keys_list = re.findall(r'(\w+)|\[(\d+)\]', keys)
+    return tuple(item for sublist in keys_list for item in sublist if item)
+
+
+def set_nested_value(data, keys, value):
+    """
+    Helper function to set a value in a nested dictionary or list.
+    'keys' can be a string like 'messages.0.content' or 'parts[0].text', or a path from parse_key_path.
+    """
+    keys_list = parse_key_path(keys) if isinstance(keys, str) else keys
+    if not keys_list:
+        raise IndexError(f"Key path '{keys}' has no segments.")
+
+    current_data = data
+    for key_part in keys_list[:-1]:
+        if key_part.isdigit():
+            key_val = int(key_part)
+            if not isinstance(current_data, list):
+                raise TypeError(f"Path segment '{key_part}' (index) is used on a non-list type '{type(current_data).__name__}'. Full path: '{keys}'")
+            if key_val >= len(current_data):
+                raise IndexError(f"List index '{key_val}' out of range. Full path: '{keys}'")
+            current_data = current_data[key_val]
+        else:
+            if not isinstance(current_data, dict):
+                raise TypeError(f"Path segment '{key_part}' (key) is used on a non-dict type '{type(current_data).__name__}'. Full path: '{keys}'")
+            current_data = current_data[key_part]
+
+    final_key_part = keys_list[-1]
+    if final_key_part.isdigit():
+        final_key_val = int(final_key_part)
+        if not isinstance(current_data, list):
+            raise TypeError(f"Final path segment '{final_key_part}' (index) is used on a non-list type '{type(current_data).__name__}'. Full path: '{keys}'")
+        if final_key_val >= len(current_data):
+            raise IndexError(f"List index '{final_key_val}' out of range. Full path: '{keys}'")
+        current_data[final_key_val] = value
+    else:
+        if not isinstance(current_data, dict):
+            raise TypeError(f"Final path segment '{final_key_part}' (key) is used on a non-dict type '{type(current_data).__name__}'. Full path: '{keys}'")
+        current_data[final_key_part] = value
+
+
+def get_nested_value(data, keys):
+    """
+    Helper function to get a value from a nested dictionary or list.
+    'keys' can be a string like 'candidates.0.content.parts.0.text', or a path from parse_key_path.
+    """
+    keys_list = parse_key_path(keys) if isinstance(keys, str) else keys
+
+    current_data = data
+    for key_part in keys_list:
+        if isinstance(current_data, dict):
+            current_data = current_data.get(key_part)
+        elif isinstance(current_data, list):
+            try:
+                current_data = current_data[int(key_part)]
+            except (ValueError, IndexError, TypeError):
+                current_data = None
+        else:
+            current_data = None
+
+        if current_data is None:
+            return 'No response content found.'
+
+    return current_data
+
+
+def _with_value(template, path, value):
+    """
+    Returns a copy of 'template' with 'value' at 'path', copying only the containers along
+    the path; everything else is shared with the template, which is never mutated.
+    The path must already have been validated with set_nested_value.
+    """
+    if not path:
+        return value
+    key_part = path[0]
+    if isinstance(template, list):
+        index = int(key_part)
+        copied = list(template)
+        copied[index] = _with_value(template[index], path[1:], value)
+    else:
+        copied = dict(template)
+        copied[key_part] = _with_value(template.get(key_part), path[1:], value)
+    return copied
+
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Compiled Schemas
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _freeze(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def content_key(schema):
+    """
+    Hashable key of the small schema values compile_schema reads. The LLM endpoint settings and
+    the training set are not part of it: CompiledSchema.matches compares those with '==', which
+    runs in C without hashing or serialising anything, so a lookup on a freshly parsed request
+    costs less than rebuilding the prompt would.
+    """
+    return (_freeze(schema.get("schemaName")), _freeze(schema.get("Fields in database table")))
+
+
+def render_training_example(training_set):
+    return f"Question: {training_set['input']}\nSQL Query: {training_set['output']}"
+
+
+def build_system_prompt(schema_name, fields_in_table, training_examples):
+    """
+    Assembles the system prompt from pre-rendered training example strings.
+    """
+    # Instruct the LLM to use the "query -> " prefix for SQL answers
+    system_prompt = f"""You are a Database Query Builder for Table {schema_name}.
+These are the fields in the database:
+{fields_in_table}
+"""
+    if training_examples:
+        training_examples_str = "\n".join(training_examples)
+        system_prompt += f"""You have the following training examples to guide your query building:
+{training_examples_str}
+"""
+    return system_prompt + PROMPT_RULES
+
+
+class CompiledSchema:
+    """
+    Question-independent parts of an LLM call for one schema.
+    'error' is a (message, status) pair when the schema's LLM body settings are unusable.
+    """
+
+    def __init__(self, schema):
+        llm_endpoint_config = schema.get('llmEndpoint') or {}
+        llm_body_config = llm_endpoint_config.get('body', {})
+
+        self.schema_name = schema.get("schemaName", "your database table")
+        self.identity_hash = _digest({
+            "schemaName": schema.get("schemaName"),
+            "fields": schema.get("Fields in database table"),
+            "url": llm_endpoint_config.get('url'),
+            "body": llm_body_config,
+        })
+        self.training_hash = _digest(schema.get("trainingSets") or [])
+        self.error = None
+        # Private copies of the values matches() compares, safe from later edits to 'schema'.
+        self.llm_endpoint = copy.deepcopy(schema.get('llmEndpoint'))
+        self.training_sets = copy.deepcopy(schema.get("trainingSets") or [])
+
+        self.fields_in_table = schema.get("Fields in database table", "No fields provided.")
+        training_sets = schema.get("trainingSets") or []
+        self.training_examples = [render_training_example(ts) for ts in training_sets]
+        self.system_prompt = build_system_prompt(self.schema_name, self.fields_in_table, self.training_examples)
+        # Large training sets get a retrieval index so each prompt carries only the relevant examples.
+        self.example_index = None
+        if RETRIEVAL_TOP_K and len(training_sets) > RETRIEVAL_TOP_K:
+            self.example_index = ExampleIndex([ts['input'] for ts in training_sets])
+
+        self.url = llm_endpoint_config.get('url')
+        self.headers = {'Content-Type': 'application/json'}
+        if llm_endpoint_config.get('authType') == 'Authorization Header':
+            self.headers['Authorization'] = llm_endpoint_config['credentials']['authHeader']
+        for header in llm_endpoint_config.get('extraHeaders', []):
+            self.headers[header['key']] = header['value']
+
+        self.response_path = parse_key_path(llm_body_config.get('responseKey', '').strip())
+        # Streaming mode: where each streamed chunk carries its text (e.g. 'choices.0.delta.content'),
+        # and the optional body key that asks the endpoint to stream (e.g. 'stream').
+        stream_response_key = llm_body_config.get('streamResponseKey', '').strip()
+        self.stream_response_path = parse_key_path(stream_response_key) if stream_response_key else self.response_path
+        self.stream_flag_path = None
+
+        self.body_template = None
+        self.query_path = None
+        sample_json_str = llm_body_config.get('sampleJson', '').strip()
+        query_key = llm_body_config.get('queryKey', '').strip()
+        stream_key = llm_body_config.get('streamKey', '').strip()
+        if sample_json_str and query_key:
+            try:
+                template = json.loads(sample_json_str)
+                query_path = parse_key_path(query_key)
+                # Validate the paths once against a scratch copy; per-request builds then skip the checks.
+                scratch = json.loads(sample_json_str)
+                set_nested_value(scratch, query_key, "")
+                if stream_key:
+                    set_nested_value(scratch, stream_key, True)
+                    self.stream_flag_path = parse_key_path(stream_key)
+                self.body_template = template
+                self.query_path = query_path
+            except json.JSONDecodeError:
+                self.error = ("Invalid JSON in LLM request body. Please check the sample JSON format.", 400)
+            except (IndexError, TypeError, KeyError) as e:
+                if "list" in str(e) and "string" in str(e):
+                    self.error = (f"Error with Query Key path: It seems you're trying to access a list with a string key. Remember to use numeric indices for lists (e.g., 'items.0.name' not 'items.name'). Original error: {str(e)}", 400)
+                else:
+                    self.error = (f"Error with Query Key path: {str(e)}. Please check the Query Key format.", 400)
+
+    def matches(self, schema):
+        """
+        Whether this was compiled from a schema with the same LLM endpoint settings and training
+        set as 'schema' (the rest of the content is covered by content_key).
+        """
+        return self.training_sets == (schema.get("trainingSets") or []) and self.llm_endpoint == schema.get('llmEndpoint')
+
+    def system_prompt_for(self, user_query):
+        """
+        The system prompt for one question: every training example for small training sets,
+        otherwise the RETRIEVAL_TOP_K most relevant ones, kept in their original order.
+        """
+        if self.example_index is None:
+            return self.system_prompt
+        selected = sorted(self.example_index.top_k(user_query, RETRIEVAL_TOP_K))
+        return build_system_prompt(self.schema_name, self.fields_in_table, [self.training_examples[i] for i in selected])
+
+    def build_request_body(self, prompt, stream=False):
+        """
+        Returns the LLM request body carrying 'prompt' at the schema's queryKey and, when
+        'stream' is set, true at its streamKey.
+        """
+        if self.body_template is None:
+            return {'query': prompt}
+        body = _with_value(self.body_template, self.query_path, prompt)
+        if stream and self.stream_flag_path:
+            body = _with_value(body, self.stream_flag_path, True)
+        return body
+
+
+def compile_schema(schema):
+    """
+    Returns the CompiledSchema for a schema document, reusing a previous compile of identical content.
+    """
+    key = content_key(schema)
+    variants = _compiled.get(key) or ()
+    for compiled in variants:
+        if compiled.matches(schema):
+            return compiled
+    compiled = CompiledSchema(schema)
+    _compiled.set(key, (compiled, *variants[:PROMPT_CACHE_VARIANTS - 1]))
+    return compiled
+
+
+def stats():
+    return _compiled.stats()
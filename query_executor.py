@@ -0,0 +1,377 @@
+"""
+In-process SQL execution shared by /api/run-query and /api/chat-query.
+
+Functions here return plain (body, status) pairs so each route decides how to
+serialise the result, and no route ever has to call another over HTTP.
+"""
+import contextvars
+import logging
+import os
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import Error as Psycopg2Error
+
+import db_pool
+import metrics
+import query_guard
+import result_cache
+from row_serializer import RowConverter
+
+STREAM_BATCH_SIZE = int(os.environ.get("DB_STREAM_BATCH_SIZE", 2000))
+STREAM_MAX_ROWS = int(os.environ.get("DB_STREAM_MAX_ROWS", 0)) # 0 means no server-side cap
+BATCH_DB_CONCURRENCY = int(os.environ.get("BATCH_DB_CONCURRENCY", 4)) # pooled connections one concurrent batch may use at once
+
+logger = logging.getLogger(__name__)
+
+INCOMPLETE_CREDENTIALS_MESSAGE = "Incomplete database credentials provided. Ensure DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, DB_PORT are set as environment variables or provided in schema."
+
+
+def resolve_db_credentials(db_credentials):
+    """
+    Resolves connection settings, letting environment variables override the schema's dbCredentials.
+    Returns None when any setting is missing.
+    """
+    credentials = {
+        "host": os.environ.get("DB_HOST", db_credentials.get('host')),
+        "user": os.environ.get("DB_USER", db_credentials.get('user')),
+        "password": os.environ.get("DB_PASSWORD", db_credentials.get('password')),
+        "database": os.environ.get("DB_NAME", db_credentials.get('database')),
+        "port": os.environ.get("DB_PORT", db_credentials.get('port')),
+    }
+    if not all(credentials.values()):
+        return None
+    return credentials
+
+
+def is_streamable(query):
+    # Only row-returning statements can be run through a server-side (named) cursor.
+    return bool(query_guard.SELECT_RE.match(query))
+
+
+def result_cache_key(db_credentials, query):
+    """
+    The result_cache key for a query under these credentials, or None when it must not be cached.
+    """
+    credentials = resolve_db_credentials(db_credentials)
+    if credentials is None:
+        return None
+    return result_cache.cache_key(db_pool.pool_key(**credentials), query)
+
+
+def _error_result(e, context):
+    """
+    Maps an exception raised while running a query to a (body, status) pair.
+    """
+    if isinstance(e, Psycopg2Error):
+        # Ensure e.pgerror is not None before stripping
+        pg_error_message = e.pgerror.strip() if e.pgerror else "Unknown database error."
+        logger.warning("Psycopg2Error in %s: %s - %s", context, e.pgcode, pg_error_message)
+        # Check if the error is due to a syntax error or a non-SQL command
+        if e.pgcode == '42601': # Syntax error
+            return {"message": f"Database query failed: Invalid SQL syntax or non-SQL command. Details: {pg_error_message}"}, 400
+        if e.pgcode == '57014': # query_canceled: statement_timeout
+            return {"message": f"Query exceeded the statement timeout and was cancelled. Details: {pg_error_message}"}, 504
+        if e.pgcode == '25006': # read_only_sql_transaction
+            return {"message": f"Query rejected: only read-only queries are allowed here. Details: {pg_error_message}"}, 403
+        return {"message": f"Database error: {e.pgcode} - {pg_error_message}"}, 500
+    if isinstance(e, query_guard.QueryRejectedError):
+        logger.info("QueryRejectedError in %s: %s", context, e)
+        return {"message": str(e)}, 422
+    if isinstance(e, db_pool.PoolTimeoutError):
+        logger.warning("PoolTimeoutError in %s: %s", context, e)
+        return {"message": f"Database is busy, please retry: {str(e)}"}, 503
+    logger.exception("Generic Exception in %s: %s", context, e)
+    return {"message": f"An unexpected error occurred during database operation: {str(e)}"}, 500
+
+
+def _run_statement(cursor, query, policy):
+    """
+    Executes one statement under 'policy' without committing it.
+    Returns (body, wrote): the response body, and whether the statement returned no rows
+    (INSERT, UPDATE, DELETE, DDL) and so has to be committed.
+    """
+    with metrics.phase(metrics.QUERY_EXECUTE):
+        query, limited = query_guard.apply(cursor, query, policy)
+        cursor.execute(query)
+        results = cursor.fetchall() if cursor.description else None
+    logger.debug("Query executed successfully.")
+
+    if cursor.description: # If it's a SELECT query, return its rows.
+        truncated = limited and len(results) > policy.row_limit
+        if truncated:
+            results = results[:policy.row_limit]
+        # Column-wise conversion to JSON-native values, converters chosen from the column type OIDs
+        with metrics.phase(metrics.SERIALIZE):
+            rows = RowConverter(cursor.description).dicts(results)
+        logger.debug("Fetched %s rows from DB.", len(rows))
+        if truncated:
+            logger.info("Result truncated at the %s row limit.", policy.row_limit)
+            return {"response": rows, "truncated": True}, False
+        return {"response": rows}, False
+    return {"response": f"Query executed successfully. Rows affected: {cursor.rowcount}"}, True
+
+
+def execute_query(db_credentials, query, policy=query_guard.DIRECT_POLICY):
+    """
+    Runs a SQL statement on a pooled connection under a query_guard policy.
+    SELECT results come back as {"response": [row dicts]}, plus "truncated": true when the
+    policy's row limit cut them short; other statements are committed and report the
+    affected row count.
+    """
+    credentials = resolve_db_credentials(db_credentials)
+    if credentials is None:
+        logger.info("Incomplete database credentials for query execution.")
+        return {"message": INCOMPLETE_CREDENTIALS_MESSAGE}, 400
+
+    pool = None
+    conn = None
+    cursor = None
+    wrote = False
+    try:
+        logger.debug("Checking out pooled DB connection: host=%s, port=%s, user=%s, database=%s", credentials['host'], credentials['port'], credentials['user'], credentials['database'])
+        pool = db_pool.get_pool(**credentials)
+        conn = pool.getconn()
+        cursor = conn.cursor()
+        logger.debug("Database connection established.")
+
+        body, wrote = _run_statement(cursor, query, policy)
+        if wrote: # For non-SELECT queries (INSERT, UPDATE, DELETE), commit changes
+            conn.commit()
+            logger.debug("Non-SELECT query committed. Rows affected: %s", cursor.rowcount)
+            result_cache.invalidate_pool(db_pool.pool_key(**credentials))
+        return body, 200
+
+    except Exception as e:
+        return _error_result(e, "execute_query")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            # Rolls back anything uncommitted and keeps the connection for reuse; a committed
+            # statement may have changed session state (SET, temp tables), so that is reset too
+            pool.putconn(conn, reset=wrote)
+            logger.debug("DB connection returned to pool.")
+
+
+def execute_batch(db_credentials, queries, policy=query_guard.DIRECT_POLICY, transaction=False):
+    """
+    Runs several statements, in order, over a single pooled connection.
+    Returns ({"results": [...]}, status) with one {"status", ...body} item per statement,
+    each the same body execute_query would have returned for it.
+
+    Without 'transaction' every statement gets its own transaction: it is committed (or rolled
+    back on error) before the next one runs, so one failure does not affect the others.
+    With 'transaction' they all share one transaction, committed only if every statement
+    succeeds; after the first failure the rest are skipped, and "committed" says whether
+    the batch took effect.
+    """
+    credentials = resolve_db_credentials(db_credentials)
+    if credentials is None:
+        logger.info("Incomplete database credentials for batch execution.")
+        return {"message": INCOMPLETE_CREDENTIALS_MESSAGE}, 400
+
+    pool = None
+    conn = None
+    try:
+        pool = db_pool.get_pool(**credentials)
+        conn = pool.getconn()
+    except Exception as e:
+        return _error_result(e, "execute_batch")
+
+    results = []
+    wrote_any = False
+    committed_any = False
+    committed = True
+    try:
+        for index, query in enumerate(queries):
+            try:
+                with conn.cursor() as cursor:
+                    body, wrote = _run_statement(cursor, query, policy)
+                if not transaction:
+                    conn.commit() # Also ends the statement's SET LOCAL settings
+                    committed_any = True
+                wrote_any = wrote_any or wrote
+                results.append({"status": 200, **body})
+            except Exception as e:
+                body, status = _error_result(e, "execute_batch")
+                results.append({"status": status, **body})
+                if conn.closed:
+                    committed = False
+                    results.extend({"status": 503, "message": "Not executed: the database connection was lost."}
+                                   for _ in queries[index + 1:])
+                    break
+                conn.rollback()
+                if transaction:
+                    committed = False
+                    results.extend({"status": 424, "message": "Not executed: an earlier statement in the transaction failed."}
+                                   for _ in queries[index + 1:])
+                    break
+        if transaction and committed:
+            conn.commit()
+            committed_any = True
+    except Exception as e:
+        # The commit itself (or a rollback) failed: nothing is known to have taken effect
+        body, status = _error_result(e, "execute_batch")
+        return {**body, "results": results}, status
+    finally:
+        # Any committed statement, even a SELECT calling set_config(), may have changed session state
+        pool.putconn(conn, reset=committed_any)
+        logger.debug("DB connection returned to pool.")
+
+    if wrote_any:
+        result_cache.invalidate_pool(db_pool.pool_key(**credentials))
+    if transaction:
+        return {"results": results, "committed": committed}, 200
+    return {"results": results}, 200
+
+
+def execute_concurrently(db_credentials, queries, policy=query_guard.DIRECT_POLICY, max_workers=BATCH_DB_CONCURRENCY):
+    """
+    Runs independent statements in parallel, each through execute_query on its own pooled
+    connection, at most 'max_workers' at a time. Returns the same shape as execute_batch.
+    """
+    if resolve_db_credentials(db_credentials) is None:
+        logger.info("Incomplete database credentials for batch execution.")
+        return {"message": INCOMPLETE_CREDENTIALS_MESSAGE}, 400
+
+    def run(query):
+        result, status = execute_query(db_credentials, query, policy)
+        return {"status": status, **result}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as executor:
+        # Each task runs in a copy of the request's context, so its phase timings still reach the request
+        futures = [executor.submit(contextvars.copy_context().run, run, query) for query in queries]
+        return {"results": [future.result() for future in futures]}, 200
+
+
+class _RowStream:
+    """
+    Response body for stream_query. Its release() returns the pooled connection; it runs when the
+    rows are exhausted, when the server closes the response, or at the latest when the body is
+    garbage collected, so a response that is never sent (e.g. an after_request hook raised)
+    cannot keep a pool slot forever.
+    """
+
+    def __init__(self, chunks, release):
+        self._chunks = chunks
+        self._release = release
+        self._finalizer = weakref.finalize(self, release)
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+        self._finalizer()
+
+
+def stream_query(db_credentials, query, dumps, output_format='ndjson', max_rows=None, columnar=False, policy=query_guard.DIRECT_POLICY):
+    """
+    Runs a SELECT through a named cursor and streams the rows back in fetchmany batches,
+    so the full result set is never held in worker memory.
+    'output_format' is 'ndjson' (one JSON value per line) or 'json' (a single chunked document).
+    With 'columnar' the column names are sent once and each row is a JSON array.
+    'dumps' encodes one JSON value, so callers keep control of how column types are rendered.
+    The query_guard policy applies, except that the row cap replaces its row limit.
+
+    The first batch is fetched before returning, so query errors come back as an error
+    (body, status) pair. On success the body is an iterable of text chunks that owns the
+    pooled connection and returns it when exhausted or closed.
+
+    A trailer {"rowCount", "truncated"[, "error"]} ends 'json' documents and columnar NDJSON.
+    Plain NDJSON has one row per line and no trailer unless an error cut it short, so a client
+    there can only tell truncation apart by asking for one row more than it needs.
+    """
+    credentials = resolve_db_credentials(db_credentials)
+    if credentials is None:
+        logger.info("Incomplete database credentials for streamed query.")
+        return {"message": INCOMPLETE_CREDENTIALS_MESSAGE}, 400
+
+    row_cap = max_rows or 0
+    if STREAM_MAX_ROWS and (not row_cap or row_cap > STREAM_MAX_ROWS):
+        row_cap = STREAM_MAX_ROWS
+
+    pool = None
+    conn = None
+    cursor = None
+    try:
+        pool = db_pool.get_pool(**credentials)
+        conn = pool.getconn()
+        with conn.cursor() as guard_cursor:
+            # Timeout, read-only and plan checks cover the named cursor's transaction too
+            query, _ = query_guard.apply(guard_cursor, query, policy, row_limit=row_cap)
+        cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cursor.itersize = STREAM_BATCH_SIZE
+        with metrics.phase(metrics.QUERY_EXECUTE):
+            cursor.execute(query)
+            first_batch = cursor.fetchmany(min(STREAM_BATCH_SIZE, row_cap) if row_cap else STREAM_BATCH_SIZE)
+        converter = RowConverter(cursor.description)
+        column_names = converter.names
+    except Exception as e:
+        if cursor:
+            cursor.close()
+        if conn:
+            pool.putconn(conn)
+        return _error_result(e, "stream_query")
+
+    released = []
+
+    def release():
+        if released:
+            return
+        released.append(True)
+        try:
+            cursor.close()
+        except Exception:
+            pass # A broken connection; putconn discards it
+        pool.putconn(conn)
+
+    def encode_rows(batch):
+        if columnar:
+            return [dumps(row) for row in converter.lists(batch)]
+        return [dumps(row) for row in converter.dicts(batch)]
+
+    def generate():
+        row_count = 0
+        truncated = False
+        error = None
+        try:
+            if output_format == 'ndjson':
+                if columnar:
+                    yield dumps({"columns": column_names}) + "\n"
+            else:
+                yield '{"columns": ' + dumps(column_names) + ', "rows": [' if columnar else '{"response": ['
+
+            batch = first_batch
+            while batch:
+                if row_cap and row_count + len(batch) > row_cap:
+                    batch = batch[:row_cap - row_count]
+                encoded = encode_rows(batch)
+                if output_format == 'ndjson':
+                    yield "\n".join(encoded) + "\n"
+                else:
+                    yield ("," if row_count else "") + ",".join(encoded)
+                row_count += len(batch)
+                if row_cap and row_count >= row_cap:
+                    truncated = bool(cursor.fetchmany(1))
+                    break
+                batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+        except Psycopg2Error as e:
+            error = e.pgerror.strip() if e.pgerror else "Unknown database error."
+            logger.warning("Psycopg2Error while streaming results: %s - %s", e.pgcode, error)
+        finally:
+            release()
+            logger.debug("Streamed %s rows from DB, connection returned to pool.", row_count)
+
+        trailer = {"rowCount": row_count, "truncated": truncated}
+        if error:
+            trailer["error"] = error
+        if output_format == 'ndjson':
+            if columnar or error:
+                yield dumps(trailer) + "\n"
+        else:
+            yield "], " + dumps(trailer)[1:]
+
+    return _RowStream(generate(), release), 200
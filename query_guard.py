@@ -0,0 +1,115 @@
+"""
+Execution policy applied to every query before it runs on a pooled connection.
+
+A QueryPolicy bounds what one statement may cost the shared database:
+- statement_timeout (SET LOCAL, so it ends with the transaction and never leaks into the pool)
+- optionally a READ ONLY transaction, for SQL written by the LLM
+- an EXPLAIN (FORMAT JSON) pre-check that rejects plans above a cost or row estimate
+- a LIMIT appended to unbounded SELECTs, one row over the limit so truncation can be reported
+
+All settings go out in a single round trip together with the EXPLAIN when one is needed.
+"""
+import os
+import re
+
+# Policy settings, overridable per deployment through environment variables. 0 disables a check.
+QUERY_STATEMENT_TIMEOUT_MS = int(os.environ.get("QUERY_STATEMENT_TIMEOUT_MS", 30000))
+QUERY_MAX_PLAN_COST = float(os.environ.get("QUERY_MAX_PLAN_COST", 0))     # planner cost units; depends on the database
+QUERY_MAX_PLAN_ROWS = float(os.environ.get("QUERY_MAX_PLAN_ROWS", 0))     # rows the planner expects the statement to return
+QUERY_ROW_LIMIT = int(os.environ.get("QUERY_ROW_LIMIT", 0))               # LIMIT for unbounded SELECTs from /api/run-query
+CHAT_QUERY_ROW_LIMIT = int(os.environ.get("CHAT_QUERY_ROW_LIMIT", 1000))  # LIMIT for unbounded SELECTs written by the LLM
+CHAT_QUERY_READ_ONLY = os.environ.get("CHAT_QUERY_READ_ONLY", "false").lower() in ("1", "true", "yes")
+
+# Row-returning statements; the one rule for streaming (query_executor), row limits and result caching.
+SELECT_RE = re.compile(r"^\s*\(*\s*(SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+EXPLAINABLE_RE = re.compile(r"^\s*\(*\s*(SELECT|WITH|VALUES|TABLE|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+# INTO also catches SELECT ... INTO new_table, which creates a table rather than returning rows.
+WRITE_KEYWORD_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|INTO)\b", re.IGNORECASE)
+BOUNDED_RE = re.compile(r"\b(LIMIT|FETCH\s+(FIRST|NEXT))\b", re.IGNORECASE)
+TRAILING_RE = re.compile(r"[\s;]+$")
+
+
+class QueryRejectedError(Exception):
+    """
+    Raised when EXPLAIN estimates a statement above the policy's cost or row limits.
+    """
+
+
+class QueryPolicy:
+    """
+    Limits for one class of queries (see DIRECT_POLICY and CHAT_POLICY).
+    """
+
+    def __init__(self, statement_timeout_ms=QUERY_STATEMENT_TIMEOUT_MS, read_only=False,
+                 max_plan_cost=QUERY_MAX_PLAN_COST, max_plan_rows=QUERY_MAX_PLAN_ROWS, row_limit=0):
+        self.statement_timeout_ms = statement_timeout_ms
+        self.read_only = read_only
+        self.max_plan_cost = max_plan_cost
+        self.max_plan_rows = max_plan_rows
+        self.row_limit = row_limit
+
+
+DIRECT_POLICY = QueryPolicy(row_limit=QUERY_ROW_LIMIT)
+CHAT_POLICY = QueryPolicy(read_only=CHAT_QUERY_READ_ONLY, row_limit=CHAT_QUERY_ROW_LIMIT)
+
+
+def _single_statement(query):
+    """
+    The query without trailing semicolons, or None when it holds several statements.
+    """
+    statement = TRAILING_RE.sub("", query)
+    return None if ";" in statement else statement
+
+
+def with_row_limit(query, row_limit):
+    """
+    Returns (query, limited): the query with 'LIMIT row_limit + 1' appended when it is a
+    single SELECT without a LIMIT/FETCH of its own and without writes (including SELECT ... INTO),
+    and whether a limit was added.
+    """
+    if not row_limit or not SELECT_RE.match(query) or BOUNDED_RE.search(query):
+        return query, False
+    statement = _single_statement(query)
+    if statement is None or WRITE_KEYWORD_RE.search(statement):
+        return query, False
+    # On its own line so a trailing '-- comment' cannot swallow it
+    return f"{statement}\nLIMIT {row_limit + 1}", True
+
+
+def _check_plan(plan_json, policy):
+    plan = plan_json[0]["Plan"]
+    cost = plan.get("Total Cost", 0)
+    rows = plan.get("Plan Rows", 0)
+    if policy.max_plan_cost and cost > policy.max_plan_cost:
+        raise QueryRejectedError(f"Query rejected: estimated cost {cost:.0f} exceeds the limit of {policy.max_plan_cost:.0f}. Add filters or a LIMIT.")
+    if policy.max_plan_rows and rows > policy.max_plan_rows:
+        raise QueryRejectedError(f"Query rejected: estimated {rows:.0f} rows exceeds the limit of {policy.max_plan_rows:.0f}. Add filters or a LIMIT.")
+
+
+def apply(cursor, query, policy, row_limit=None):
+    """
+    Prepares the cursor's (not yet started) transaction for 'query' under 'policy' and returns
+    (query, limited): the statement to execute and whether a LIMIT was added to it.
+    'row_limit' overrides the policy's limit, e.g. with a stream's row cap.
+    Raises QueryRejectedError when the plan is over budget.
+    """
+    query, limited = with_row_limit(query, policy.row_limit if row_limit is None else row_limit)
+
+    settings = []
+    params = []
+    if policy.read_only:
+        settings.append("SET TRANSACTION READ ONLY")
+    if policy.statement_timeout_ms:
+        settings.append("SET LOCAL statement_timeout = %s")
+        params.append(policy.statement_timeout_ms)
+
+    explain = ((policy.max_plan_cost or policy.max_plan_rows) and EXPLAINABLE_RE.match(query)
+               and _single_statement(query) is not None)
+    if explain:
+        # Escape '%' so psycopg2 does not read the statement's own text as placeholders
+        settings.append("EXPLAIN (FORMAT JSON) " + _single_statement(query).replace("%", "%%"))
+    if settings:
+        cursor.execute("; ".join(settings), params)
+    if explain:
+        _check_plan(cursor.fetchone()[0], policy)
+    return query, limited
@@ -0,0 +1,117 @@
+"""
+Opt-in cache of encoded /api/run-query results for repeated read-only SELECTs.
+
+Keys combine the connection pool identity (see db_pool.pool_key) with the SQL text,
+whitespace-normalised outside string literals when the text has no quoted identifiers, comments
+or other quoting forms (those queries are keyed on their exact text). Values are the response body already
+encoded as JSON bytes, so a hit skips both the database and serialisation. Entries expire
+after RESULT_CACHE_TTL seconds and the least recently used are evicted once their total
+size passes RESULT_CACHE_MAX_BYTES. Any write committed through the same pool drops that
+pool's entries and bumps its generation, so a read that was already running when the write
+committed cannot store its stale result afterwards. Writes made elsewhere (other workers,
+other clients) are only bounded by the TTL.
+"""
+import os
+import re
+import threading
+
+import query_guard
+from cache import TTLCache
+
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 30))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 4096))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESULT_CACHE_MAX_ENTRY_BYTES", 1024 * 1024)) # Larger results are not worth evicting others for
+
+# Statements whose result can change between two identical runs, or that take row locks.
+VOLATILE_RE = re.compile(
+    r"\b(now|random|clock_timestamp|statement_timestamp|timeofday|current_timestamp|current_time|localtime|localtimestamp"
+    r"|nextval|currval|setval|lastval|gen_random_uuid|uuid_generate_v\w*|pg_sleep|txid_current)\b"
+    r"|\bFOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b",
+    re.IGNORECASE,
+)
+STRING_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+# Quoted identifiers, comments, dollar quoting and backslash escapes, whose whitespace is
+# significant or which STRING_LITERAL_RE cannot delimit.
+UNNORMALISABLE_RE = re.compile(r'"|--|/\*|\$|\\')
+
+_cache = TTLCache(max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES)
+_generations = {} # pool key -> number of invalidations so far
+_generations_lock = threading.Lock()
+
+
+def normalize_sql(query):
+    """
+    Collapses whitespace and drops trailing semicolons, leaving string literals untouched.
+    Queries containing anything UNNORMALISABLE_RE matches are returned unchanged.
+    """
+    if UNNORMALISABLE_RE.search(query):
+        return query
+    parts = STRING_LITERAL_RE.split(query.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+
+
+def is_cacheable(query):
+    """
+    True for a single read-only SELECT without volatile functions or locking clauses.
+    """
+    if not query_guard.SELECT_RE.match(query) or VOLATILE_RE.search(query):
+        return False
+    statement = query_guard.TRAILING_RE.sub("", query)
+    return ";" not in statement and not query_guard.WRITE_KEYWORD_RE.search(statement)
+
+
+def cache_key(pool_key, query):
+    """
+    Returns the cache key for a query on a pool, or None when the cache is off or the query is not cacheable.
+    """
+    if not RESULT_CACHE_ENABLED or not is_cacheable(query):
+        return None
+    return (pool_key, normalize_sql(query))
+
+
+def lookup(key):
+    """
+    Returns the cached encoded body for a key, or None.
+    """
+    if key is None:
+        return None
+    return _cache.get(key)
+
+
+def generation(key):
+    """
+    The current generation of a cache key's pool. Take it before running the query and pass
+    it to store().
+    """
+    if key is None:
+        return None
+    with _generations_lock:
+        return _generations.get(key[0], 0)
+
+
+def store(key, encoded, generation):
+    """
+    Caches an encoded result, unless a write invalidated its pool since 'generation' was taken.
+    """
+    if key is None or len(encoded) > RESULT_CACHE_MAX_ENTRY_BYTES:
+        return
+    with _generations_lock:
+        if _generations.get(key[0], 0) == generation:
+            _cache.set(key, encoded, size=len(encoded))
+
+
+def invalidate_pool(pool_key):
+    """
+    Drops every cached result read through a pool, after a write was committed on it.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return 0
+    with _generations_lock:
+        _generations[pool_key] = _generations.get(pool_key, 0) + 1
+        return _cache.invalidate_where(lambda key: key[0] == pool_key)
+
+
+def stats():
+    return {**_cache.stats(), "enabled": RESULT_CACHE_ENABLED}
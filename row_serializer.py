@@ -0,0 +1,239 @@
+"""
+JSON encoding of database rows.
+
+RowConverter picks one converter per column from the type OIDs in cursor.description and,
+with the standard library encoder, applies it column by column, in place, so rows reach json
+holding only JSON-native values. The formats are the ones Flask's jsonify used for these types:
+dates and timestamps as HTTP dates, numeric and uuid as strings. Types jsonify could not encode
+get a readable form: bytea as Postgres' '\\x' hex, time as ISO 8601.
+
+JSONProvider is a Flask JSON provider that encodes with orjson when it is installed
+(JSON_BACKEND=auto, the default) and falls back to the standard library otherwise.
+With orjson RowConverter converts nothing: orjson calls the provider's default hook, a Python
+function, once per non-native value (numeric, timestamps, uuid...). That measured about as fast
+as converting up front and keeps no converted copy of the rows.
+
+Both backends produce the same bytes, except that floats with an exponent read 1e16 under orjson
+and 1e+16 under json. Where that differs from Flask's default provider, it is deliberate:
+- NaN and Infinity are sent as null. Flask sent the bare NaN/Infinity tokens, which are not
+  JSON and which JSON.parse rejects; orjson cannot produce them.
+- Non-ASCII text is sent as UTF-8 rather than as \\uXXXX escapes.
+- dumps() without arguments is compact (no spaces after ',' and ':').
+"""
+import datetime
+import decimal
+import math
+import os
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+
+try:
+    import orjson
+except ImportError: # Optional: only makes encoding faster
+    orjson = None
+
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto").lower() # 'auto' (orjson if installed) or 'stdlib'
+USE_ORJSON = orjson is not None and JSON_BACKEND != "stdlib"
+
+# Postgres type OIDs (pg_type.oid) with values psycopg2 does not return as JSON-native types.
+BYTEA_OID = 17
+NUMERIC_OID = 1700
+DATE_OID = 1082
+TIME_OIDS = (1083, 1266)
+TIMESTAMP_OIDS = (1114, 1184)
+INTERVAL_OID = 1186
+UUID_OID = 2950
+# ...and those it does, which need no conversion at all.
+NATIVE_OIDS = frozenset((
+    16,                 # bool
+    20, 21, 23, 26,     # int8, int2, int4, oid
+    700, 701,           # float4, float8
+    18, 19, 25, 1042, 1043, # char, name, text, bpchar, varchar
+    114, 3802,          # json, jsonb (already parsed)
+))
+NATIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _http_date(value):
+    """
+    Same output as werkzeug.http.http_date (naive values are UTC), several times faster.
+    """
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return (f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} "
+            f"{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+
+
+def _bytea(value):
+    return "\\x" + bytes(value).hex()
+
+
+def _time(value):
+    return value.isoformat()
+
+
+_BY_OID = {BYTEA_OID: _bytea, NUMERIC_OID: str, DATE_OID: _http_date, INTERVAL_OID: str, UUID_OID: str}
+_BY_OID.update({oid: _time for oid in TIME_OIDS})
+_BY_OID.update({oid: _http_date for oid in TIMESTAMP_OIDS})
+
+_BY_TYPE = {
+    decimal.Decimal: str,
+    uuid.UUID: str,
+    datetime.datetime: _http_date,
+    datetime.date: _http_date,
+    datetime.time: _time,
+    datetime.timedelta: str,
+    memoryview: _bytea,
+    bytes: _bytea,
+}
+
+
+def convert_value(value):
+    """
+    Converts one value of any type (arrays and composite types included) to a JSON-native one.
+    """
+    kind = type(value)
+    if kind in NATIVE_TYPES:
+        return value
+    converter = _BY_TYPE.get(kind)
+    if converter is not None:
+        return converter(value)
+    if isinstance(value, (list, tuple)):
+        return [convert_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: convert_value(item) for key, item in value.items()}
+    return value # Left for the JSON provider's default hook
+
+
+def converter_for(type_code):
+    """
+    The converter for a column type, or None when its values are already JSON-native.
+    """
+    if type_code in NATIVE_OIDS:
+        return None
+    if USE_ORJSON:
+        # orjson passes the remaining types to JSONProvider's default hook one value at a
+        # time: same output, about as fast, and no converted copy of the column held in memory
+        return None
+    converter = _BY_OID.get(type_code)
+    if converter is not None:
+        return converter
+    return convert_value # Arrays, enums, ranges, or a driver that reports no OIDs
+
+
+class RowConverter:
+    """
+    Column names and converters for one cursor.description, chosen once per result set.
+    """
+
+    def __init__(self, description):
+        self.names = [column[0] for column in description]
+        self.converters = [converter_for(column[1]) for column in description]
+        self._by_index = [(index, converter) for index, converter in enumerate(self.converters) if converter is not None]
+        # With duplicate column names the last column's value is the one a dict keeps
+        self._by_name = list({name: converter for name, converter in zip(self.names, self.converters)}.items())
+        self._by_name = [(name, converter) for name, converter in self._by_name if converter is not None]
+
+    @staticmethod
+    def _convert(rows, conversions):
+        for key, converter in conversions:
+            for row in rows:
+                value = row[key]
+                if value is not None:
+                    row[key] = converter(value)
+        return rows
+
+    def dicts(self, rows):
+        """
+        Rows as a list of {column name: value} dicts.
+        """
+        names = self.names
+        return self._convert([dict(zip(names, row)) for row in rows], self._by_name)
+
+    def lists(self, rows):
+        """
+        Rows as a list of value lists, in column order.
+        """
+        return self._convert([list(row) for row in rows], self._by_index)
+
+
+def _default(value):
+    converted = convert_value(value)
+    if converted is value:
+        return DefaultJSONProvider.default(value)
+    return converted
+
+
+def _finite(value):
+    """
+    A copy of 'value' with NaN and infinite floats replaced by None, which is what orjson sends.
+    """
+    kind = type(value)
+    if kind is float:
+        return value if math.isfinite(value) else None
+    if kind in (list, tuple):
+        return [_finite(item) for item in value]
+    if kind is dict:
+        return {key: _finite(item) for key, item in value.items()}
+    return value
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider with the default one's formats (sorted keys, HTTP dates, Decimal and UUID
+    as strings), encoded by orjson when available. Output is the same with either backend; see
+    the module docstring for where it differs from Flask's.
+    """
+
+    use_orjson = USE_ORJSON
+    ensure_ascii = False # As orjson does
+
+    def _orjson_dumps(self, obj, indent=None):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and set(kwargs) <= {"separators", "indent"}:
+            try:
+                return self._orjson_dumps(obj, kwargs.get("indent")).decode("utf-8")
+            except (orjson.JSONEncodeError, TypeError):
+                pass # e.g. integers beyond 64 bits; the standard library copes
+        kwargs.setdefault("default", _default)
+        if kwargs.get("indent") is None:
+            kwargs.setdefault("separators", (",", ":"))
+        try:
+            return super().dumps(obj, allow_nan=False, **kwargs)
+        except ValueError as e:
+            if not str(e).startswith("Out of range float values"):
+                raise
+        # Only results holding NaN or Infinity pay for the copy
+        return super().dumps(_finite(obj), allow_nan=False, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with metrics.phase(metrics.SERIALIZE):
+            return self._response(*args, **kwargs)
+
+    def _response(self, *args, **kwargs):
+        if not self.use_orjson:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = self._orjson_dumps(obj, indent)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().response(obj)
+        # A list body gets its Content-Length set without copying a large body to append the newline
+        return self._app.response_class([body, b"\n"], mimetype=self.mimetype)
@@ -0,0 +1,106 @@
+"""
+In-memory cache of parsed schema documents in front of the SFTP schema store.
+
+Entries are keyed by (sftp host, port, username, schemaName). Within SCHEMA_CACHE_TTL a
+cached schema is served without touching SFTP; after that it is revalidated with a remote
+stat and only re-downloaded if the file's mtime or size changed.
+"""
+import os
+import threading
+
+from cache import TTLCache
+from pool_registry import password_digest
+
+SCHEMA_CACHE_TTL = float(os.environ.get("SCHEMA_CACHE_TTL", 30))             # seconds served without revalidation
+SCHEMA_CACHE_MAX_ENTRIES = int(os.environ.get("SCHEMA_CACHE_MAX_ENTRIES", 256))
+
+_cache = TTLCache(max_entries=SCHEMA_CACHE_MAX_ENTRIES, ttl=SCHEMA_CACHE_TTL)
+_counters_lock = threading.Lock()
+_revalidations = 0
+_downloads = 0
+
+
+class CachedSchema:
+    __slots__ = ("document", "mtime", "size", "password_digest")
+
+    def __init__(self, document, mtime, size, password_digest):
+        self.document = document
+        self.mtime = mtime
+        self.size = size
+        self.password_digest = password_digest
+
+    def matches(self, attrs):
+        """
+        True when the remote file's stat attributes show it has not changed since it was cached.
+        """
+        return attrs.st_mtime == self.mtime and attrs.st_size == self.size
+
+
+def cache_key(host, port, username, schema_name):
+    return (host, int(port), username, schema_name)
+
+
+def lookup(key, password):
+    """
+    Returns (CachedSchema, fresh) or None.
+    Entries cached under a different password are treated as absent, so a cached schema
+    is never handed to a caller who could not have read it from the server.
+    """
+    found = _cache.get_entry(key)
+    if found is None:
+        return None
+    entry, fresh = found
+    if entry.password_digest != password_digest(password):
+        return None
+    return entry, fresh
+
+
+def record_hit():
+    _cache.record_hit()
+
+
+def record_revalidated(key):
+    """
+    Records that a stale entry was confirmed unchanged by a remote stat, and marks it fresh.
+    """
+    global _revalidations
+    _cache.touch(key)
+    _cache.record_hit()
+    with _counters_lock:
+        _revalidations += 1
+
+
+def store(key, password, document, attrs):
+    """
+    Caches a schema document along with the stat attributes it was read (or written) with.
+    Counts as a miss, since the caller had to transfer the document.
+    """
+    global _downloads
+    _cache.set(key, CachedSchema(document, attrs.st_mtime, attrs.st_size, password_digest(password)))
+    _cache.record_miss()
+    with _counters_lock:
+        _downloads += 1
+
+
+def put(key, password, document, attrs):
+    """
+    Write-through update after save_schema uploads a document.
+    """
+    _cache.set(key, CachedSchema(document, attrs.st_mtime, attrs.st_size, password_digest(password)))
+
+
+def invalidate(key):
+    _cache.pop(key)
+
+
+def invalidate_schema(host, port, schema_name):
+    """
+    Drops a schema from the cache for every account on the given SFTP server.
+    """
+    return _cache.invalidate_where(lambda key: key[0] == host and key[1] == int(port) and key[3] == schema_name)
+
+
+def stats():
+    with _counters_lock:
+        counters = {"revalidations": _revalidations, "downloads": _downloads}
+    return {**_cache.stats(), **counters, "ttl": _cache.ttl}
@@ -0,0 +1,283 @@
+"""
+Reusable SFTP sessions for the schema store, one bounded pool per (host, port, username).
+
+Each session is an authenticated paramiko Transport with an open SFTPClient, so
+save_schema and get_schema only pay the SSH handshake when no idle session is available.
+"""
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+
+import metrics
+from pool_registry import PoolRegistry, password_digest
+
+SFTP_POOL_MAX_SIZE = int(os.environ.get("SFTP_POOL_MAX_SIZE", 4))
+SFTP_POOL_IDLE_TIMEOUT = float(os.environ.get("SFTP_POOL_IDLE_TIMEOUT", 120))          # seconds before an idle session is closed
+SFTP_POOL_CHECKOUT_TIMEOUT = float(os.environ.get("SFTP_POOL_CHECKOUT_TIMEOUT", 15))   # seconds to wait for a free session
+SFTP_POOL_LIVENESS_CHECK_AFTER = float(os.environ.get("SFTP_POOL_LIVENESS_CHECK_AFTER", 30))  # round-trip check if idle longer than this
+SFTP_KEEPALIVE_INTERVAL = int(os.environ.get("SFTP_KEEPALIVE_INTERVAL", 30))           # seconds between SSH keepalive packets
+SFTP_POOL_SWEEP_INTERVAL = float(os.environ.get("SFTP_POOL_SWEEP_INTERVAL", 60))       # seconds between sweeps of idle sessions and unused pools
+
+# Errors that mean the session itself is unusable, as opposed to e.g. a missing remote file.
+SESSION_ERRORS = (paramiko.SSHException, EOFError, ConnectionError, socket.timeout)
+
+
+class SFTPPoolTimeoutError(Exception):
+    """
+    Raised when no SFTP session becomes available within the checkout timeout.
+    """
+
+
+class SFTPSession:
+    """
+    An authenticated transport plus its SFTP client.
+    """
+
+    def __init__(self, transport, sftp):
+        self.transport = transport
+        self.sftp = sftp
+        self.returned_at = time.monotonic()
+
+    def is_active(self):
+        return self.transport.is_active()
+
+    def close(self):
+        try:
+            self.sftp.close()
+        except Exception:
+            pass
+        try:
+            self.transport.close()
+        except Exception:
+            pass
+
+
+class SFTPSessionPool:
+    """
+    Bounded pool of SFTP sessions for one server account.
+    """
+
+    def __init__(self, host, port, username, password, max_size=SFTP_POOL_MAX_SIZE,
+                 idle_timeout=SFTP_POOL_IDLE_TIMEOUT, checkout_timeout=SFTP_POOL_CHECKOUT_TIMEOUT,
+                 liveness_check_after=SFTP_POOL_LIVENESS_CHECK_AFTER):
+        self.host = host
+        self.port = port
+        self.username = username
+        self._password = password
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.liveness_check_after = liveness_check_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # most recently returned last
+        self._size = 0
+        self._closed = False
+        self.last_used = time.monotonic() # Last get_pool() for this pool; see sweep()
+
+        self.handshakes = 0
+        self.handshake_failures = 0
+        self.handshake_time_total = 0.0
+        self.hits = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.liveness_failures = 0
+        self.evictions = 0
+        self.discards = 0
+
+    def _open_session(self):
+        started = time.monotonic()
+        transport = paramiko.Transport((self.host, self.port))
+        try:
+            transport.connect(username=self.username, password=self._password)
+            transport.set_keepalive(SFTP_KEEPALIVE_INTERVAL)
+            sftp = paramiko.SFTPClient.from_transport(transport)
+        except Exception:
+            transport.close()
+            with self._cond:
+                self.handshake_failures += 1
+            raise
+        handshake_time = time.monotonic() - started
+        with self._cond:
+            self.handshakes += 1
+            self.handshake_time_total += handshake_time
+        metrics.observe_phase(metrics.SFTP_CONNECT, handshake_time)
+        return SFTPSession(transport, sftp)
+
+    def _evict_idle_locked(self, now):
+        while self._idle and now - self._idle[0].returned_at >= self.idle_timeout:
+            session = self._idle.pop(0)
+            self._size -= 1
+            self.evictions += 1
+            session.close()
+
+    def sweep(self, now):
+        """
+        Closes expired idle sessions. Returns True when the pool holds no sessions and has not
+        been asked for within the idle timeout, i.e. it can be dropped.
+        """
+        with self._cond:
+            self._evict_idle_locked(now)
+            return self._size == 0 and now - self.last_used >= self.idle_timeout
+
+    def _is_alive(self, session):
+        if not session.is_active():
+            return False
+        if time.monotonic() - session.returned_at < self.liveness_check_after:
+            return True
+        try:
+            session.sftp.normalize(".")
+            return True
+        except Exception:
+            return False
+
+    def getsession(self):
+        """
+        Checks out a live session, opening a new one when none is idle and the pool has room.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise SFTPPoolTimeoutError("SFTP session pool has been closed.")
+                waited = False
+                while True:
+                    now = time.monotonic()
+                    self._evict_idle_locked(now)
+                    if self._idle:
+                        session = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        session = None
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise SFTPPoolTimeoutError(
+                            f"No SFTP session to {self.host} available after {self.checkout_timeout:.1f}s."
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if waited:
+                    self.waits += 1
+
+            if session is None:
+                try:
+                    return self._open_session()
+                except Exception:
+                    self._release_slot()
+                    with self._cond:
+                        never_connected = self.handshakes == 0 and self._size == 0
+                    if never_connected:
+                        _registry.forget(self)
+                    raise
+
+            if self._is_alive(session):
+                with self._cond:
+                    self.hits += 1
+                return session
+
+            session.close()
+            with self._cond:
+                self.liveness_failures += 1
+            self._release_slot()
+
+    def putsession(self, session, discard=False):
+        """
+        Returns a session to the pool, or closes it if it is broken or 'discard' is set.
+        """
+        with self._cond:
+            if not discard and not self._closed and session.is_active():
+                session.returned_at = time.monotonic()
+                self._idle.append(session)
+                self._cond.notify()
+                return
+            self.discards += 1
+        session.close()
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def sftp(self):
+        """
+        Context manager yielding a pooled paramiko.SFTPClient.
+        Sessions that fail with a transport-level error are discarded instead of reused.
+        """
+        session = self.getsession()
+        discard = False
+        try:
+            yield session.sftp
+        except SESSION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.putsession(session, discard=discard)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for session in idle:
+            session.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "inUse": self._size - len(self._idle),
+                "maxSize": self.max_size,
+                "handshakes": self.handshakes,
+                "handshakeFailures": self.handshake_failures,
+                "handshakeTimeTotal": round(self.handshake_time_total, 6),
+                "hits": self.hits,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "livenessFailures": self.liveness_failures,
+                "evictions": self.evictions,
+                "discards": self.discards,
+            }
+
+
+_registry = PoolRegistry("sftp-pool", SFTP_POOL_SWEEP_INTERVAL)
+
+
+def get_pool(host, port, username, password):
+    """
+    Returns the process-wide session pool for an SFTP account, creating it on first use.
+    """
+    key = (host, int(port), username, password_digest(password))
+    return _registry.get(key, lambda: SFTPSessionPool(host, int(port), username, password))
+
+
+def sweep():
+    """
+    Closes expired idle sessions in every pool and drops pools left empty and unused.
+    Without this, keepalives would hold sessions of accounts that stopped getting traffic open forever.
+    """
+    _registry.sweep()
+
+
+def pool_stats():
+    """
+    Snapshot of every SFTP pool in this process, without credentials.
+    """
+    return [{"host": pool.host, "port": pool.port, "username": pool.username, **pool.stats()} for _, pool in _registry.items()]
+
+
+def close_all():
+    """
+    Closes and forgets every SFTP pool in this process.
+    """
+    _registry.close_all()
@@ -0,0 +1,79 @@
+"""
+Cache of natural-language-to-SQL translations produced by the LLM in chat_query.
+
+Keys combine the schema identity (name, fields and LLM endpoint settings), a hash of the
+training set and the normalised user question, so a repeated question against an unchanged
+schema skips the LLM round trip entirely. Any edit to the schema changes the key.
+"""
+import os
+import re
+import threading
+
+from cache import TTLCache
+
+TRANSLATION_CACHE_ENABLED = os.environ.get("TRANSLATION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSLATION_CACHE_TTL = float(os.environ.get("TRANSLATION_CACHE_TTL", 3600))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSLATION_CACHE_MAX_ENTRIES", 2048))
+
+# Only read-only translations are replayed from cache.
+CACHEABLE_SQL_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+_cache = TTLCache(max_entries=TRANSLATION_CACHE_MAX_ENTRIES, ttl=TRANSLATION_CACHE_TTL)
+_stats_lock = threading.Lock()
+_saved_llm_seconds = 0.0
+
+
+def normalize_query(user_query):
+    """
+    Lower-cases, collapses whitespace and drops trailing punctuation, so
+    "How many orders today?" and "how many  orders today" share an entry.
+    """
+    return re.sub(r"\s+", " ", user_query).strip().rstrip("?.!;").strip().lower()
+
+
+def cache_key(compiled, user_query):
+    """
+    Returns the cache key for a question against a compiled schema (see prompt_builder),
+    or None when caching is disabled.
+    """
+    if not TRANSLATION_CACHE_ENABLED:
+        return None
+    return (compiled.schema_name, compiled.identity_hash, compiled.training_hash, normalize_query(user_query))
+
+
+def lookup(key):
+    """
+    Returns the cached SQL for a key, or None. Hits credit the LLM latency they saved.
+    """
+    global _saved_llm_seconds
+    if key is None:
+        return None
+    cached = _cache.get(key)
+    if cached is None:
+        return None
+    sql_query, llm_seconds = cached
+    with _stats_lock:
+        _saved_llm_seconds += llm_seconds
+    return sql_query
+
+
+def store(key, sql_query, llm_seconds):
+    """
+    Caches a translation together with how long the LLM took to produce it.
+    """
+    if key is None or not CACHEABLE_SQL_RE.match(sql_query):
+        return
+    _cache.set(key, (sql_query, llm_seconds))
+
+
+def invalidate_schema(schema_name):
+    """
+    Drops every cached translation for a schema name.
+    """
+    return _cache.invalidate_where(lambda key: key[0] == schema_name)
+
+
+def stats():
+    with _stats_lock:
+        saved = _saved_llm_seconds
+    return {**_cache.stats(), "enabled": TRANSLATION_CACHE_ENABLED, "savedLlmSeconds": round(saved, 3)}